@@ -8,9 +8,11 @@ def create_app():
     app = Flask(__name__, template_folder="templates", static_folder="static")
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "change-me")
 
-    # Инициализируем БД (простая sqlite через наши функции)
-    from .models import init_db
-    init_db()
+    # БД инициализируется лениво — при первом подключении (см. models.connect)
+
+    # Дозапись новых заявок в Google Sheets — фоновым потоком, пачками (см. sheets_sync)
+    from .sheets_sync import install_write_behind
+    install_write_behind()
 
     # Регистрируем blueprints
     from .auth import bp as auth_bp
@@ -22,4 +24,13 @@ def create_app():
     def health():
         return {"ok": True}
 
+    from .auth import login_required
+
+    @app.get("/metrics/http")
+    @login_required
+    def http_metrics():
+        # переиспользование keep-alive соединений общего пула (см. clients.http_stats)
+        import clients
+        return {"pool": clients.pool_config(), "stats": clients.http_stats()}
+
     return app
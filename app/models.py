@@ -1,42 +1,177 @@
-import sqlite3, csv, os
+import sqlite3, csv, json, os, re, threading, time
 from contextlib import closing
 from datetime import datetime
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Callable, Dict, Any, List, Tuple, Optional
 from werkzeug.security import generate_password_hash, check_password_hash
+from leads_dedup import Deduplicator, normalize_phone, phone_hash
 
 DB_PATH = os.path.join(os.getcwd(), "app.sqlite")
 
+# Собран ли SQLite с FTS5 (выясняется при создании схемы)
+FTS_ENABLED = True
+
+# БД, для которых схема уже создана в этом процессе — DDL не гоняем на каждом старте/запросе
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
 def connect():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    if DB_PATH not in _schema_ready:
+        _ensure_schema(conn)
     return conn
 
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    with _schema_lock:
+        if DB_PATH in _schema_ready:
+            return
+        # воркеры после деплоя стартуют одновременно: BEGIN IMMEDIATE берёт блокировку записи
+        # до чтения PRAGMA table_info — миграцию делает один процесс, остальные ждут и видят новую схему
+        conn.execute("BEGIN IMMEDIATE")
+        with conn:
+            _create_schema(conn)
+        _schema_ready.add(DB_PATH)
+        pending = _pending_backfill(conn)
+        if pending:
+            print(f"[DB] Старые заявки ещё не обработаны ({', '.join(pending)}): python -m app.models backfill")
+
 def init_db():
-    with closing(connect()) as conn, conn:
-        # пользователи
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            name TEXT,
-            password_hash TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        );
-        """)
-        # заявки
+    """Явное создание схемы. Обычно не нужно: connect() делает это сам при первом подключении."""
+    _schema_ready.discard(DB_PATH)
+    with closing(connect()):
+        pass
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    # пользователи
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        name TEXT,
+        password_hash TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    """)
+    # заявки
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS leads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        client_name TEXT,
+        client_phone TEXT,
+        service TEXT,
+        comment TEXT,
+        source TEXT
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_service ON leads(service);")
+    # дедупликация: нормализованный телефон (E.164) и его хэш + ссылка на первую заявку клиента;
+    # client_phone остаётся таким, как его ввели
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(leads)")}
+    migrated = False
+    if "phone_e164" not in cols:
+        conn.execute("ALTER TABLE leads ADD COLUMN phone_e164 TEXT;")
+        migrated = True
+    if "phone_hash" not in cols:
+        conn.execute("ALTER TABLE leads ADD COLUMN phone_hash TEXT;")
+        migrated = True
+    if "duplicate_of" not in cols:
+        conn.execute("ALTER TABLE leads ADD COLUMN duplicate_of INTEGER;")
+        migrated = True
+    # долгие проходы по истории не делаем на первом запросе воркера — только отмечаем,
+    # их выполняет python -m app.models backfill
+    conn.execute("CREATE TABLE IF NOT EXISTS pending_backfill (name TEXT PRIMARY KEY);")
+    has_leads = conn.execute("SELECT 1 FROM leads LIMIT 1").fetchone() is not None
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_phone_hash ON leads(phone_hash, id);")
+    # покрывающий индекс для уникальных клиентов за период; заменяет индекс только по created_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_created_phone ON leads(created_at, phone_hash);")
+    conn.execute("DROP INDEX IF EXISTS idx_leads_created_at;")
+    if migrated and has_leads:
+        _mark_backfill(conn, "dedup")  # старые заявки: нормализуем телефоны и размечаем дубли
+    if _create_fts(conn) and has_leads:
+        _mark_backfill(conn, "fts")  # индекс создан, заявки до него в нём ещё не лежат
+    # очередь на дозапись новых заявок в Google Sheets (см. app/sheets_sync.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sheet_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        lead_id INTEGER,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sheet_outbox_next ON sheet_outbox(next_attempt_at, id);")
+
+def _create_fts(conn: sqlite3.Connection) -> bool:
+    """
+    Полнотекстовый индекс по имени/комментарию/услуге (FTS5, external content — тексты не дублируются).
+    Синхронизируется триггерами на insert/update/delete. Если SQLite собран без FTS5 —
+    поиск работает через LIKE (медленно, но работает). Возвращает True, если индекс только что создан.
+    """
+    global FTS_ENABLED
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'leads_fts'"
+    ).fetchone() is not None
+    try:
         conn.execute("""
-        CREATE TABLE IF NOT EXISTS leads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at TEXT NOT NULL,
-            client_name TEXT,
-            client_phone TEXT,
-            service TEXT,
-            comment TEXT,
-            source TEXT
+        CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(
+            client_name, comment, service,
+            content='leads', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
         );
         """)
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_created_at ON leads(created_at);")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_service ON leads(service);")
+    except sqlite3.OperationalError:
+        FTS_ENABLED = False
+        return False
+    FTS_ENABLED = True
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS leads_fts_ai AFTER INSERT ON leads BEGIN
+        INSERT INTO leads_fts(rowid, client_name, comment, service)
+        VALUES (new.id, new.client_name, new.comment, new.service);
+    END;
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS leads_fts_ad AFTER DELETE ON leads BEGIN
+        INSERT INTO leads_fts(leads_fts, rowid, client_name, comment, service)
+        VALUES ('delete', old.id, old.client_name, old.comment, old.service);
+    END;
+    """)
+    # только по индексируемым полям — нормализация телефонов индекс не трогает
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS leads_fts_au AFTER UPDATE OF client_name, comment, service ON leads BEGIN
+        INSERT INTO leads_fts(leads_fts, rowid, client_name, comment, service)
+        VALUES ('delete', old.id, old.client_name, old.comment, old.service);
+        INSERT INTO leads_fts(rowid, client_name, comment, service)
+        VALUES (new.id, new.client_name, new.comment, new.service);
+    END;
+    """)
+    return not existed
+
+def _mark_backfill(conn: sqlite3.Connection, name: str) -> None:
+    conn.execute("INSERT OR IGNORE INTO pending_backfill (name) VALUES (?)", (name,))
+
+def _pending_backfill(conn: sqlite3.Connection) -> List[str]:
+    return [r[0] for r in conn.execute("SELECT name FROM pending_backfill ORDER BY name")]
+
+def backfill() -> Dict[str, Any]:
+    """
+    Отложенные после миграции проходы по истории заявок (идемпотентны):
+      dedup — E.164 и разметка дублей для старых заявок (см. _dedup_pass)
+      fts   — заполнение полнотекстового индекса заявками, созданными до него
+    """
+    done: Dict[str, Any] = {}
+    with closing(connect()) as conn:
+        for name in _pending_backfill(conn):
+            with conn:
+                if name == "dedup":
+                    done[name] = _dedup_pass(conn)
+                elif name == "fts" and FTS_ENABLED:
+                    conn.execute("INSERT INTO leads_fts(leads_fts) VALUES ('rebuild');")
+                    done[name] = True
+                conn.execute("DELETE FROM pending_backfill WHERE name = ?", (name,))
+    return done
 
 # ---------- Users ----------
 def create_user(email: str, name: str, password: str) -> int:
@@ -59,13 +194,81 @@ def verify_user(email: str, password: str):
     return None
 
 # ---------- Leads ----------
+# Подписчики очереди Sheets: пока их нет, заявки в outbox не пишутся
+_outbox_listeners: List[Callable[[], None]] = []
+
+def subscribe_outbox(callback: Callable[[], None]) -> None:
+    """Включает запись новых заявок в sheet_outbox; callback() зовётся после каждой записи."""
+    if callback not in _outbox_listeners:
+        _outbox_listeners.append(callback)
+
+def unsubscribe_outbox(callback: Callable[[], None]) -> None:
+    if callback in _outbox_listeners:
+        _outbox_listeners.remove(callback)
+
 def add_lead(client_name: str, client_phone: str, service: str, comment: str, source: str = "солнечный луч") -> int:
+    # телефон храним как ввели + отдельно E.164 (если распознали), дубль ищем по индексу phone_hash
+    e164 = normalize_phone(client_phone)
+    key = phone_hash(e164)
+    created_at = datetime.utcnow().isoformat()
     with closing(connect()) as conn, conn:
+        first = None
+        if key:
+            row = conn.execute(
+                "SELECT id, duplicate_of FROM leads WHERE phone_hash = ? ORDER BY id LIMIT 1", (key,)
+            ).fetchone()
+            if row:
+                first = row["duplicate_of"] or row["id"]
         cur = conn.execute("""
-            INSERT INTO leads (created_at, client_name, client_phone, service, comment, source)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (datetime.utcnow().isoformat(), client_name, client_phone, service, comment, source))
-        return cur.lastrowid
+            INSERT INTO leads (created_at, client_name, client_phone, service, comment, source,
+                               phone_e164, phone_hash, duplicate_of)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (created_at, client_name, client_phone, service, comment, source, e164, key, first))
+        lead_id = cur.lastrowid
+        if _outbox_listeners:
+            # в той же транзакции, что и заявка: падение процесса не теряет строку для таблицы
+            payload = {
+                "created_at": created_at,
+                "client_name": client_name,
+                "client_phone": client_phone,
+                "service": service,
+                "comment": comment,
+                "source": source,
+            }
+            conn.execute(
+                "INSERT INTO sheet_outbox (lead_id, payload, created_at) VALUES (?, ?, ?)",
+                (lead_id, json.dumps(payload, ensure_ascii=False), created_at),
+            )
+    for cb in _outbox_listeners:
+        cb()
+    return lead_id
+
+def _dedup_pass(conn: sqlite3.Connection, chunk: int = 10000) -> Dict[str, int]:
+    """
+    Один проход по всей истории: phone_e164, phone_hash и duplicate_of заново.
+    client_phone не трогаем — исходный ввод остаётся, даже если номер не распознан.
+    """
+    d = Deduplicator()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, client_phone FROM leads WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for lead_id, raw in rows:
+            e164 = normalize_phone(raw)
+            first = d.seen(raw, ref=lead_id)
+            updates.append((e164, phone_hash(e164), first, lead_id))
+        conn.executemany("UPDATE leads SET phone_e164 = ?, phone_hash = ?, duplicate_of = ? WHERE id = ?", updates)
+        last_id = rows[-1][0]
+    return {"total": d.total, "unique_clients": d.unique, "duplicates": d.duplicates}
+
+def dedup_leads() -> Dict[str, int]:
+    """Пакетная дедупликация всей истории заявок (идемпотентна)."""
+    with closing(connect()) as conn, conn:
+        return _dedup_pass(conn)
 
 def _daterange(date_from: str, date_to: str) -> Tuple[str, Tuple[str, str]]:
     start, end = f"{date_from}T00:00:00", f"{date_to}T23:59:59"
@@ -74,7 +277,13 @@ def _daterange(date_from: str, date_to: str) -> Tuple[str, Tuple[str, str]]:
 def stats_overview(date_from: str, date_to: str) -> Dict[str, Any]:
     clause, params = _daterange(date_from, date_to)
     with closing(connect()) as conn:
-        total = conn.execute(f"SELECT COUNT(*) c FROM leads WHERE {clause}", params).fetchone()["c"]
+        counts = conn.execute(f"""
+            SELECT COUNT(*) c, COUNT(DISTINCT phone_hash) k, COALESCE(SUM(phone_hash IS NULL), 0) n
+            FROM leads WHERE {clause}
+        """, params).fetchone()
+        total = counts["c"]
+        # заявки без распознанного телефона склеить не по чему — каждая считается отдельным клиентом
+        unique_clients = counts["k"] + counts["n"]
         by_day = conn.execute(f"""
             SELECT substr(created_at,1,10) day, COUNT(*) c
             FROM leads WHERE {clause} GROUP BY day ORDER BY day
@@ -85,10 +294,133 @@ def stats_overview(date_from: str, date_to: str) -> Dict[str, Any]:
         """, params).fetchall()
         return {
             "total": total,
+            "unique_clients": unique_clients,
+            "duplicates": total - unique_clients,
             "by_day": [(r["day"], r["c"]) for r in by_day],
             "by_service": [(r["service"], r["c"]) for r in by_service],
         }
 
+# ---------- Sheets outbox ----------
+def claim_outbox(limit: int, lease_sec: float = 120.0) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    Забирает до limit готовых к отправке строк и «арендует» их на lease_sec,
+    чтобы другой процесс не отправил их же. Не подтверждённые ack_outbox вернутся после аренды.
+
+    Очередь строго по порядку: пока самая старая строка ждёт повтора (или арендована),
+    более новые не выдаются — иначе они попали бы в таблицу раньше неё.
+    """
+    now = time.time()
+    with closing(connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                """
+                SELECT id, payload FROM sheet_outbox
+                WHERE next_attempt_at <= ?
+                  AND id < COALESCE((SELECT MIN(id) FROM sheet_outbox WHERE next_attempt_at > ?), 9e18)
+                ORDER BY id LIMIT ?
+                """,
+                (now, now, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE sheet_outbox SET next_attempt_at = ? WHERE id = ?",
+                    [(now + lease_sec, r["id"]) for r in rows],
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return [(r["id"], json.loads(r["payload"])) for r in rows]
+
+def ack_outbox(ids: List[int]) -> None:
+    """Строки записаны в таблицу — удаляем из очереди."""
+    if not ids:
+        return
+    with closing(connect()) as conn, conn:
+        conn.executemany("DELETE FROM sheet_outbox WHERE id = ?", [(i,) for i in ids])
+
+def retry_outbox(ids: List[int], delay_sec: float) -> None:
+    """Отправка не удалась — вернуть строки в очередь не раньше чем через delay_sec."""
+    if not ids:
+        return
+    at = time.time() + delay_sec
+    with closing(connect()) as conn, conn:
+        conn.executemany(
+            "UPDATE sheet_outbox SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+            [(at, i) for i in ids],
+        )
+
+def outbox_size() -> int:
+    with closing(connect()) as conn:
+        return conn.execute("SELECT COUNT(*) c FROM sheet_outbox").fetchone()["c"]
+
+# ---------- Search ----------
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+def _fts_query(text: str) -> Optional[str]:
+    """
+    Строка пользователя -> запрос FTS5: каждое слово ищется как префикс,
+    а длинные слова ещё и по первой половине — опечатка во второй половине слова не мешает найти заявку
+    («окрашевание» найдёт «окрашивание» через «окраш*»). Точные совпадения набирают больший rank.
+    """
+    terms = []
+    for w in _WORD.findall((text or "").lower())[:8]:
+        variants = [f'"{w}"*']
+        if len(w) >= 5:
+            variants.append(f'"{w[:max(3, len(w) // 2)]}"*')
+        terms.append(variants[0] if len(variants) == 1 else f"({' OR '.join(variants)})")
+    return " AND ".join(terms) or None
+
+def search_leads(text: str, page: int = 1, per_page: int = 50,
+                 date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Поиск заявок по имени/комментарию/услуге, по релевантности (bm25), постранично.
+    date_from/date_to ("YYYY-MM-DD", любой можно опустить) — ограничить период.
+    Возвращает {"items": [...], "total": N, "page": p, "pages": P, "per_page": k}.
+    """
+    page = max(int(page or 1), 1)
+    offset = (page - 1) * per_page
+    result = {"items": [], "total": 0, "page": page, "pages": 0, "per_page": per_page}
+    cols = "l.id, l.created_at, l.client_name, l.client_phone, l.service, l.comment, l.source"
+    dated = bool(date_from or date_to)
+    date_clause, date_params = _daterange(date_from or "0000-01-01", date_to or "9999-12-31")
+    with closing(connect()) as conn:
+        if FTS_ENABLED:
+            q = _fts_query(text)
+            if not q:
+                return result
+            where = "leads_fts MATCH ?" + (f" AND l.{date_clause}" if dated else "")
+            params = (q, *date_params) if dated else (q,)
+            if dated:
+                total = conn.execute(
+                    f"SELECT COUNT(*) c FROM leads_fts f JOIN leads l ON l.id = f.rowid WHERE {where}", params
+                ).fetchone()["c"]
+            else:
+                total = conn.execute("SELECT COUNT(*) c FROM leads_fts WHERE leads_fts MATCH ?", params).fetchone()["c"]
+            rows = conn.execute(f"""
+                SELECT {cols} FROM leads_fts f JOIN leads l ON l.id = f.rowid
+                WHERE {where} ORDER BY f.rank LIMIT ? OFFSET ?
+            """, (*params, per_page, offset)).fetchall()
+        else:
+            words = _WORD.findall(text or "")[:8]
+            if not words:
+                return result
+            clause = " AND ".join(["(client_name LIKE ? OR comment LIKE ? OR service LIKE ?)"] * len(words))
+            params = [p for w in words for p in (f"%{w}%",) * 3]
+            if dated:
+                clause += f" AND {date_clause}"
+                params += list(date_params)
+            total = conn.execute(f"SELECT COUNT(*) c FROM leads l WHERE {clause}", params).fetchone()["c"]
+            rows = conn.execute(
+                f"SELECT {cols} FROM leads l WHERE {clause} ORDER BY l.created_at DESC LIMIT ? OFFSET ?",
+                (*params, per_page, offset),
+            ).fetchall()
+    result["items"] = [dict(r) for r in rows]
+    result["total"] = total
+    result["pages"] = (total + per_page - 1) // per_page
+    return result
+
 def export_csv(date_from: str, date_to: str) -> str:
     path = f"leads_{date_from}_{date_to}.csv"
     clause, params = _daterange(date_from, date_to)
@@ -101,3 +433,13 @@ def export_csv(date_from: str, date_to: str) -> str:
         ):
             w.writerow(r)
     return path
+
+# Обработка истории после миграции: python -m app.models backfill
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Служебные операции с БД заявок")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+
+    result = backfill()
+    print(f"готово: {result}" if result else "нечего делать")
@@ -0,0 +1,217 @@
+# app/sheets_sync.py — буферизованная дозапись новых заявок в Google Sheets (write-behind)
+#
+# add_lead пишет строку в sqlite-очередь sheet_outbox в той же транзакции, что и заявку,
+# и сразу возвращается. Фоновый поток раз в SHEETS_FLUSH_INTERVAL секунд (или раньше,
+# когда набралось SHEETS_FLUSH_BATCH строк) отправляет очередь одним append_rows.
+# При ошибках квоты Sheets API — экспоненциальный бэкофф; строки остаются в очереди.
+#
+# Поток стартует в create_app и перезапускается при первой заявке в процессе, где его нет
+# (воркер uWSGI/gunicorn после fork). Если потоки недоступны (uWSGI без enable-threads),
+# очередь разбирается по расписанию:
+#   python -m app.sheets_sync flush
+#
+# Настройки (env):
+#   SHEETS_WRITEBACK       — 0: выключить дозапись (по умолчанию включена, если задан GOOGLE_SHEET_ID)
+#   SHEETS_FLUSH_INTERVAL  — период отправки, сек (10)
+#   SHEETS_FLUSH_BATCH     — сколько новых строк будят поток раньше срока (50)
+#   SHEETS_FLUSH_MAX_ROWS  — максимум строк в одном append_rows (500)
+#   SHEETS_MAX_BACKOFF     — потолок паузы при ошибках квоты, сек (300)
+import os
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import sheets_reader
+from . import models
+
+# Колонки по умолчанию, если в таблице нет строки заголовка
+DEFAULT_COLUMNS = ["created_at", "client_name", "client_phone", "service", "comment", "source"]
+
+
+def _is_quota_error(e: Exception) -> bool:
+    """gspread.exceptions.APIError с 429 / rateLimitExceeded — ждём, а не ретраим сразу."""
+    resp = getattr(e, "response", None)
+    status = getattr(resp, "status_code", None)
+    if status == 429:
+        return True
+    text = str(e).lower()
+    return "quota" in text or "ratelimitexceeded" in text or "resource_exhausted" in text
+
+
+class SheetsWriteBehind:
+    def __init__(
+        self,
+        interval: float = 10.0,
+        batch_size: int = 50,
+        max_rows: int = 500,
+        max_backoff: float = 300.0,
+        open_ws: Optional[Callable[[], Any]] = None,
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.max_backoff = max_backoff
+        self._open_ws = open_ws or (lambda: sheets_reader._open_ws())
+        self._ws = None
+        self._columns: Optional[Dict[str, int]] = None
+        self._width = 0
+        self._backoff = 0.0
+        self._retry_delay = 0.0  # через сколько повторять упавшую пачку (бэкофф + разброс)
+        self._new_rows = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"flushes": 0, "rows_written": 0, "quota_errors": 0, "errors": 0}
+
+    # ----------------------- lifecycle -----------------------
+
+    def start(self) -> "SheetsWriteBehind":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sheets-write-behind", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def notify(self) -> None:
+        """Новая строка в очереди (зовётся из add_lead). Ничего не ждёт и не ходит в сеть."""
+        if self._thread is None or not self._thread.is_alive():
+            # поток, запущенный до fork, в воркере не существует — поднимаем свой
+            with self._lock:
+                if not self._stop.is_set():
+                    self.start()
+        with self._lock:
+            self._new_rows += 1
+            if self._new_rows >= self.batch_size:
+                self._wake.set()
+
+    # ----------------------- flushing -----------------------
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self._retry_delay or self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            with self._lock:
+                self._new_rows = 0
+            # выгребаем очередь, пока есть полные пачки и нет ошибок
+            while not self._stop.is_set():
+                try:
+                    sent = self.flush_once()
+                except Exception as e:
+                    print(f"[SheetsWriteBehind] Ошибка отправки: {e}")
+                    break
+                if sent < self.max_rows:
+                    break
+
+    def flush_once(self) -> int:
+        """Одна пачка: claim -> append_rows -> ack. Возвращает число записанных строк."""
+        batch = models.claim_outbox(self.max_rows)
+        if not batch:
+            return 0
+        ids = [i for i, _ in batch]
+        try:
+            ws = self._worksheet()
+            # RAW: текст из формы пишется как есть — "=HYPERLINK(...)" не станет формулой, "+7900..." числом
+            ws.append_rows([self._to_row(p) for _, p in batch], value_input_option="RAW")
+        except Exception as e:
+            quota = _is_quota_error(e)
+            self.stats["quota_errors" if quota else "errors"] += 1
+            if not quota:
+                self._ws = None  # на всякий случай переоткроем лист и перечитаем заголовок
+            self._backoff = min(self.max_backoff, max(self.interval, self._backoff * 2))
+            # поток проснётся ровно тогда, когда пачку можно брать снова; более новые строки
+            # до тех пор не выдаются (claim_outbox держит порядок)
+            self._retry_delay = self._backoff * (1 + random.random() * 0.25)
+            models.retry_outbox(ids, self._retry_delay)
+            raise
+        models.ack_outbox(ids)
+        self._backoff = self._retry_delay = 0.0
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += len(ids)
+        return len(ids)
+
+    def _worksheet(self):
+        if self._ws is None:
+            ws = self._open_ws()
+            header = [(h or "").strip() for h in ws.row_values(1)]
+            columns = sheets_reader._normalize_header_row(header) if header else {}
+            if not columns:
+                columns = {k: i for i, k in enumerate(DEFAULT_COLUMNS)}
+            self._ws, self._columns = ws, columns
+            self._width = max(len(header), max(columns.values()) + 1)
+        return self._ws
+
+    def _to_row(self, payload: Dict[str, Any]) -> List[str]:
+        row = [""] * self._width
+        for key, idx in self._columns.items():
+            row[idx] = payload.get(key) or ""
+        return row
+
+
+_writer: Optional[SheetsWriteBehind] = None
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _from_env() -> SheetsWriteBehind:
+    return SheetsWriteBehind(
+        interval=_env_float("SHEETS_FLUSH_INTERVAL", 10),
+        batch_size=int(_env_float("SHEETS_FLUSH_BATCH", 50)),
+        max_rows=int(_env_float("SHEETS_FLUSH_MAX_ROWS", 500)),
+        max_backoff=_env_float("SHEETS_MAX_BACKOFF", 300),
+    )
+
+
+def install_write_behind() -> Optional[SheetsWriteBehind]:
+    """
+    Включает дозапись, если она не выключена и задан GOOGLE_SHEET_ID.
+    Сети не трогает: лист открывается при первой отправке.
+    """
+    global _writer
+    if _writer is not None:
+        return _writer
+    if os.getenv("SHEETS_WRITEBACK", "1") in ("0", "false", "no") or not os.getenv("GOOGLE_SHEET_ID"):
+        return None
+    _writer = _from_env()
+    models.subscribe_outbox(_writer.notify)
+    return _writer.start()
+
+
+def flush_all() -> int:
+    """Разовая отправка всей очереди без фонового потока (для cron/scheduled task). Возвращает число строк."""
+    writer = _from_env()
+    total = 0
+    while True:
+        sent = writer.flush_once()
+        total += sent
+        if sent < writer.max_rows:
+            return total
+
+
+# Разбор очереди по расписанию: python -m app.sheets_sync flush
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Дозапись заявок из sheet_outbox в Google Sheets")
+    parser.add_argument("command", choices=["flush", "size"])
+    args = parser.parse_args()
+
+    if args.command == "size":
+        print(f"в очереди: {models.outbox_size()}")
+    else:
+        try:
+            print(f"записано строк: {flush_all()}, осталось в очереди: {models.outbox_size()}")
+        except Exception as e:
+            raise SystemExit(f"[SheetsWriteBehind] Ошибка отправки: {e}")
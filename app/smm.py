@@ -1,10 +1,12 @@
 # app/smm.py
 import os
-from flask import Blueprint, render_template, request, flash
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Response, abort, jsonify, render_template, request, flash, redirect, session, url_for, stream_with_context
 from .auth import login_required
-from generators.text_gen import PostGenerator
-from generators.image_gen import ImageGenerator
-from social_publishers.vk_publisher import VKPublisher
+from .models import add_lead, search_leads
 from sheets_reader import read_leads, compute_summary
 
 
@@ -15,6 +17,34 @@ bp = Blueprint("smm", __name__)  # если уже есть, повторно н
 def dashboard():
     return render_template("dashboard.html")
 
+def _image_url(image_path: str) -> str:
+    # превратим файловый путь в URL для тега <img>
+    # image_path, например: "app/static/generated_images/xxx.png"
+    rel = image_path.split("app/static/", 1)[-1]
+    return f"/static/{rel}"
+
+def _generate_image(key: str, img_prompt: str) -> str:
+    from generators.image_gen import ImageGenerator
+    # кладём в статическую папку, чтобы можно было отдать через Flask
+    out_dir = os.path.join("app", "static", "generated_images")
+    os.makedirs(out_dir, exist_ok=True)
+    ig = ImageGenerator(openai_key=key, out_dir=out_dir)
+    return ig.generate_image(img_prompt)
+
+def _publish_vk(text: str, image_path) -> str:
+    """Публикует пост в VK, возвращает ссылку или текст ошибки для показа пользователю."""
+    vk_key = os.getenv("VK_API_KEY")
+    vk_group = os.getenv("VK_GROUP_ID")
+    if not vk_key or not vk_group:
+        return "VK_API_KEY/VK_GROUP_ID не заданы в .env — публикация пропущена."
+    try:
+        from social_publishers.vk_publisher import VKPublisher
+        pub = VKPublisher(vk_api_key=vk_key, group_id=int(vk_group))
+        pub_res = pub.publish_post(text, image_path=image_path)
+        return pub_res.get("permalink") or "Опубликовано (ссылку VK не вернул)."
+    except Exception as e:
+        return f"Ошибка публикации VK: {e}"
+
 @bp.route("/post-generator", methods=["GET", "POST"])
 @login_required
 def post_generator():
@@ -33,6 +63,7 @@ def post_generator():
         if not key:
             result_text = "OPENAI_API_KEY не задан в .env"
         else:
+            from generators.text_gen import PostGenerator
             pg = PostGenerator(openai_key=key, tone=tone, topic=topic)
             result_text = pg.generate_post()
             img_prompt = pg.generate_post_image_description() if gen_image else None
@@ -40,29 +71,12 @@ def post_generator():
             # 2) Картинка (если чекбокс включён)
             image_path = None
             if gen_image and img_prompt:
-                # кладём в статическую папку, чтобы можно было отдать через Flask
-                out_dir = os.path.join("app", "static", "generated_images")
-                os.makedirs(out_dir, exist_ok=True)
-                ig = ImageGenerator(openai_key=key, out_dir=out_dir)
-                image_path = ig.generate_image(img_prompt)
-                # превратим файловый путь в URL для тега <img>
-                # image_path, например: "app/static/generated_images/xxx.png"
-                rel = image_path.split("app/static/", 1)[-1]
-                image_url = f"/static/{rel}"
+                image_path = _generate_image(key, img_prompt)
+                image_url = _image_url(image_path)
 
             # 3) Автопубликация в VK (если чекбокс включён)
             if autopost_vk:
-                vk_key = os.getenv("VK_API_KEY")
-                vk_group = os.getenv("VK_GROUP_ID")
-                if not vk_key or not vk_group:
-                    permalink = "VK_API_KEY/VK_GROUP_ID не заданы в .env — публикация пропущена."
-                else:
-                    try:
-                        pub = VKPublisher(vk_api_key=vk_key, group_id=int(vk_group))
-                        pub_res = pub.publish_post(result_text, image_path=image_path)
-                        permalink = pub_res.get("permalink") or "Опубликовано (ссылку VK не вернул)."
-                    except Exception as e:
-                        permalink = f"Ошибка публикации VK: {e}"
+                permalink = _publish_vk(result_text, image_path)
 
     return render_template(
         "postgen/generator.html",
@@ -72,20 +86,242 @@ def post_generator():
         image_url=image_url,
         permalink=permalink,
     )
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+_MAX_STREAM_JOBS = 5  # сколько незапущенных заданий держим в сессии
+
+@bp.route("/post-generator/stream", methods=["POST"])
+@login_required
+def post_generator_job():
+    """
+    Создаёт задание для потокового генератора (тема, тон, флаги) и возвращает его id и URL потока.
+    Всё, что меняет состояние (публикация в VK), задаётся только здесь — POST-ом.
+    """
+    job_id = uuid.uuid4().hex
+    jobs = dict(session.get("postgen_jobs") or {})
+    jobs[job_id] = {
+        "tone": request.form.get("tone", "нейтральный"),
+        "topic": request.form.get("topic", ""),
+        "gen_image": request.form.get("gen_image") == "on",
+        "autopost_vk": request.form.get("autopost_vk") == "on",
+    }
+    # в cookie-сессии храним только последние задания
+    session["postgen_jobs"] = dict(list(jobs.items())[-_MAX_STREAM_JOBS:])
+    return jsonify({"id": job_id, "url": url_for("smm.post_generator_stream", job_id=job_id)})
+
+@bp.route("/post-generator/stream/<job_id>", methods=["GET"])
+@login_required
+def post_generator_stream(job_id):
+    """
+    Server-Sent Events для задания из post_generator_job. GET только читает задание
+    (и снимает его из сессии — повтор запроса прокси или префетч не опубликует пост второй раз). События:
+      token      — очередной кусок текста {"text": ...}
+      text_done  — текст сгенерирован
+      image      — картинка готова {"url": ...} (или {"error": ...})
+      published  — результат публикации VK {"permalink": ...}
+      error      — ошибка {"message": ...}
+      done       — поток завершён
+    """
+    jobs = dict(session.get("postgen_jobs") or {})
+    job = jobs.pop(job_id, None)
+    if job is not None:
+        session["postgen_jobs"] = jobs
+    tone = (job or {}).get("tone", "нейтральный")
+    topic = (job or {}).get("topic", "")
+    gen_image = bool((job or {}).get("gen_image"))
+    autopost_vk = bool((job or {}).get("autopost_vk"))
+    key = os.getenv("OPENAI_API_KEY", "")
+
+    def events():
+        if job is None:
+            yield _sse("error", {"message": "Задание не найдено или уже выполнено — отправьте форму ещё раз"})
+            yield _sse("done", {})
+            return
+        if not key:
+            yield _sse("error", {"message": "OPENAI_API_KEY не задан в .env"})
+            yield _sse("done", {})
+            return
+
+        from generators.text_gen import PostGenerator
+        pg = PostGenerator(openai_key=key, tone=tone, topic=topic)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            # картинка не зависит от текста поста — готовим её параллельно со стримом
+            image_future = None
+            if gen_image:
+                image_future = pool.submit(lambda: _generate_image(key, pg.generate_post_image_description()))
+
+            # текст копим только если он нужен для публикации
+            parts = [] if autopost_vk else None
+            try:
+                for piece in pg.generate_post_stream():
+                    if parts is not None:
+                        parts.append(piece)
+                    yield _sse("token", {"text": piece})
+            except Exception as e:
+                yield _sse("error", {"message": f"Ошибка генерации текста: {e}"})
+                yield _sse("done", {})
+                return
+            yield _sse("text_done", {})
+
+            image_path = None
+            if image_future is not None:
+                try:
+                    image_path = image_future.result()
+                except Exception as e:
+                    yield _sse("image", {"error": str(e)})
+                else:
+                    if image_path:
+                        yield _sse("image", {"url": _image_url(image_path)})
+                    else:
+                        yield _sse("image", {"error": "Не удалось сгенерировать изображение"})
+
+            if autopost_vk:
+                yield _sse("published", {"permalink": _publish_vk("".join(parts), image_path)})
+
+        yield _sse("done", {})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---------- Кампании (пакетная генерация и публикация, см. campaign.py) ----------
+CAMPAIGNS_DIR = os.getenv("CAMPAIGNS_DIR", "campaigns")
+
+def _campaign_file(cid: str):
+    if not cid.isalnum():
+        return None
+    for ext in (".csv", ".jsonl"):
+        path = os.path.join(CAMPAIGNS_DIR, cid + ext)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def _campaign_running(path: str) -> bool:
+    # файл-блокировка рядом с кампанией — видно из любого воркера сервера
+    from campaign import is_running
+    return is_running(path)
+
+def _start_campaign(cid: str, path: str) -> bool:
+    """Запускает кампанию фоновым потоком; False — уже идёт (в любом процессе)."""
+    from campaign import CampaignLock, run_campaign
+
+    lock = CampaignLock(path)
+    if not lock.acquire():
+        return False
+
+    def work():
+        try:
+            run_campaign(path, lock=lock)
+        except Exception as e:
+            print(f"[Campaign] {cid}: {e}")
+        finally:
+            lock.release()
+
+    threading.Thread(target=work, name=f"campaign-{cid}", daemon=True).start()
+    return True
+
+@bp.route("/campaigns", methods=["GET", "POST"])
+@login_required
+def campaigns():
+    from campaign import progress
+    if request.method == "POST":
+        f = request.files.get("file")
+        ext = os.path.splitext(f.filename or "")[1].lower() if f else ""
+        if ext not in (".csv", ".jsonl"):
+            flash("Загрузите файл .csv или .jsonl", "danger")
+        elif not os.getenv("OPENAI_API_KEY") or not os.getenv("VK_API_KEY"):
+            flash("OPENAI_API_KEY/VK_API_KEY не заданы в .env", "danger")
+        else:
+            from campaign import validate_campaign
+            os.makedirs(CAMPAIGNS_DIR, exist_ok=True)
+            cid = uuid.uuid4().hex[:12]
+            path = os.path.join(CAMPAIGNS_DIR, cid + ext)
+            # сначала проверяем во временном файле: в список кампаний попадает только корректный
+            tmp_path = path + ".upload"
+            f.save(tmp_path)
+            n_rows, errors = validate_campaign(tmp_path)
+            if errors or not n_rows:
+                os.remove(tmp_path)
+                flash("Файл не принят: " + ("; ".join(errors) if errors else "нет ни одной строки с topic"), "danger")
+            else:
+                os.replace(tmp_path, path)
+                _start_campaign(cid, path)
+                return redirect(url_for("smm.campaign_view", cid=cid))
+
+    items = []
+    if os.path.isdir(CAMPAIGNS_DIR):
+        for name in sorted(os.listdir(CAMPAIGNS_DIR), reverse=True):
+            cid, ext = os.path.splitext(name)
+            if ext in (".csv", ".jsonl") and cid.isalnum():
+                path = os.path.join(CAMPAIGNS_DIR, name)
+                items.append({"id": cid, "progress": progress(path), "running": _campaign_running(path),
+                              "mtime": os.path.getmtime(path)})
+    items.sort(key=lambda c: c["mtime"], reverse=True)
+    return render_template("campaigns/index.html", campaigns=items)
+
+@bp.route("/campaigns/<cid>", methods=["GET", "POST"])
+@login_required
+def campaign_view(cid):
+    from campaign import progress
+    path = _campaign_file(cid)
+    if not path:
+        abort(404)
+    if request.method == "POST":
+        # повторный запуск продолжает с чекпоинта: готовые посты не публикуются второй раз
+        if not _start_campaign(cid, path):
+            flash("Кампания уже выполняется", "danger")
+        return redirect(url_for("smm.campaign_view", cid=cid))
+    return render_template("campaigns/view.html", cid=cid, progress=progress(path),
+                           running=_campaign_running(path))
+
+@bp.route("/leads/new", methods=["GET", "POST"])
+@login_required
+def lead_new():
+    if request.method == "POST":
+        client_name = request.form.get("client_name", "").strip()
+        client_phone = request.form.get("client_phone", "").strip()
+        if not client_name or not client_phone:
+            flash("Имя и телефон обязательны", "danger")
+        else:
+            # только sqlite: в Google Sheets строка уйдёт пачкой из фоновой очереди
+            add_lead(client_name, client_phone,
+                     request.form.get("service", "").strip(),
+                     request.form.get("comment", "").strip())
+            flash("Заявка сохранена", "success")
+            return redirect(url_for("smm.lead_new"))
+    return render_template("forms/leads_new.html")
+
 @bp.route("/stats", methods=["GET"])
 @login_required
 def stats():
     # Параметры фильтра: даты (необязательно)
     date_from = request.args.get("from", "").strip() or None
     date_to   = request.args.get("to", "").strip() or None
+    q         = request.args.get("q", "").strip()
+    page      = request.args.get("page", 1, type=int)
+
+    # поиск по заявкам из БД (FTS5) — отдельно от выгрузки Google Sheets
+    search = None
+    if q:
+        try:
+            search = search_leads(q, page=page, date_from=date_from, date_to=date_to)
+        except Exception as e:
+            flash(f"Ошибка поиска: {e}", "danger")
 
+    # при поиске выгрузку Google Sheets не читаем: поиск отвечает за миллисекунды,
+    # а полное чтение таблиц — секунды на каждую смену страницы
     rows = []
     summary = None
-    try:
-        rows = read_leads(date_from, date_to)
-        summary = compute_summary(rows)
-    except Exception as e:
-        flash(f"Ошибка чтения Google Sheets: {e}", "danger")
+    if not q:
+        try:
+            rows = read_leads(date_from, date_to)
+            summary = compute_summary(rows)
+        except Exception as e:
+            flash(f"Ошибка чтения Google Sheets: {e}", "danger")
 
     # чтобы таблица не была слишком большой при первом открытии — покажем первые 200 строк
     MAX_ROWS = 200
@@ -99,6 +335,7 @@ def stats():
         ("service",     "Услуга"),
         ("comment",     "Комментарий"),
         ("source",      "Источник"),
+        ("source_tab",  "Вкладка"),
         # заглушки на будущее:
         ("manager",     "Менеджер"),
         ("city",        "Город"),
@@ -113,4 +350,6 @@ def stats():
                            columns=columns,
                            summary=summary,
                            total_all=len(rows),
-                           max_rows=MAX_ROWS)
+                           max_rows=MAX_ROWS,
+                           q=q,
+                           search=search)
@@ -0,0 +1,2 @@
+# benchmarks — офлайн-замеры производительности без живых OpenAI/VK/Google Sheets.
+# Запуск: python -m benchmarks.run --help
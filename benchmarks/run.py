@@ -0,0 +1,423 @@
+# benchmarks/run.py — офлайн-бенчмарки с сохранением baseline
+#
+#   python -m benchmarks.run                      # все сценарии + сравнение с baseline
+#   python -m benchmarks.run -k sheets            # только сценарии, в имени которых есть "sheets"
+#   python -m benchmarks.run --save-baseline      # перезаписать baseline текущими цифрами
+#   python -m benchmarks.run --error-rate 0.05    # 5% ответов внешних API — HTTP 500
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from unittest import mock
+
+from benchmarks.stubs import StubServer, FakeSpreadsheet, FakeWorksheet, make_sheet_values, TINY_PNG
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class Scenario:
+    """
+    setup(ctx, stack) готовит окружение и возвращает функцию, время которой меряем.
+    stack — ExitStack, в него складываем патчи/временные файлы (закроется после прогона).
+    """
+
+    def __init__(self, name: str, setup: Callable[["BenchContext", ExitStack], Callable[[], Any]], repeat: int = 5,
+                 self_timed: bool = False):
+        self.name = name
+        self.setup = setup
+        self.repeat = repeat
+        # self_timed=True — функция сама меряет время и возвращает секунды (например, замер в дочернем процессе)
+        self.self_timed = self_timed
+
+
+class BenchContext:
+    def __init__(self, stub: StubServer, workdir: str, sheets_latency: float, error_rate: float):
+        self.stub = stub
+        self.workdir = workdir
+        self.sheets_latency = sheets_latency
+        self.error_rate = error_rate
+
+
+@contextmanager
+def _stub_env(stub: StubServer):
+    """Направляет OpenAI/VK клиентов на локальный stub-сервер."""
+    env = {
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": stub.openai_base_url,
+        "VK_API_KEY": "vk-bench",
+        "VK_GROUP_ID": "1",
+        "VK_API_BASE": stub.vk_api_base,
+    }
+    with mock.patch.dict(os.environ, env):
+        yield
+
+
+def _temp_db(ctx: BenchContext, stack: ExitStack, name: str) -> str:
+    from app import models
+    path = os.path.join(ctx.workdir, name)
+    if os.path.exists(path):
+        os.remove(path)
+    stack.enter_context(mock.patch.object(models, "DB_PATH", path))
+    models.init_db()
+    return path
+
+
+def _seed_leads(path: str, n_rows: int) -> None:
+    """Заполняет leads строками как из таблицы (минуя add_lead — сырые телефоны, без дедупликации)."""
+    values = make_sheet_values(n_rows)[1:]
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            "INSERT INTO leads (created_at, client_name, client_phone, service, comment, source) VALUES (?,?,?,?,?,?)",
+            ((r[0][:19], r[1], r[2], r[3], r[4], r[5]) for r in values),
+        )
+
+
+def _logged_in_client(ctx: BenchContext, stack: ExitStack, db_name: str):
+    """Flask test client с залогиненной сессией; cwd — во временной папке (туда пишутся картинки)."""
+    from app import create_app
+    _temp_db(ctx, stack, db_name)
+    app = create_app()
+    # view пишет картинки в app/static/generated_images относительно cwd — уводим во временную папку
+    prev_cwd = os.getcwd()
+    os.chdir(ctx.workdir)
+    stack.callback(os.chdir, prev_cwd)
+
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = 1
+        s["user_name"] = "bench"
+    return client
+
+
+# ----------------------------
+# Сценарии
+# ----------------------------
+
+def _sheets_summary(n_rows: int):
+    def setup(ctx: BenchContext, stack: ExitStack):
+        import sheets_reader
+        sh = FakeSpreadsheet("bench", {"Лист1": make_sheet_values(n_rows)},
+                             latency=ctx.sheets_latency, error_rate=ctx.error_rate)
+        stack.enter_context(mock.patch.object(sheets_reader, "_open_spreadsheet", lambda sheet_id: sh.open()))
+
+        def run():
+            rows = sheets_reader.read_leads(sources="bench")
+            return sheets_reader.compute_summary(rows)
+        return run
+    return setup
+
+
+def _sheets_multi_tab(n_spreadsheets: int, tabs_each: int, rows_per_tab: int):
+    """
+    Несколько таблиц по несколько вкладок (все вкладки, "*"): на таблицу — открытие + один batch_get,
+    таблицы параллельно. Сравнивать с тем же числом строк в одной вкладке (sheets_tab_12k).
+    """
+    def setup(ctx: BenchContext, stack: ExitStack):
+        import sheets_reader
+        books = {}
+        for i in range(n_spreadsheets):
+            tabs = {f"Месяц {j + 1}": make_sheet_values(rows_per_tab, seed=i * 100 + j) for j in range(tabs_each)}
+            books[f"book{i}"] = FakeSpreadsheet(f"Таблица {i}", tabs, latency=ctx.sheets_latency,
+                                                error_rate=ctx.error_rate)
+        stack.enter_context(mock.patch.object(sheets_reader, "_open_spreadsheet", lambda sheet_id: books[sheet_id].open()))
+        spec = ";".join(f"{sid}:*" for sid in books)
+
+        def run():
+            return sheets_reader.compute_summary(sheets_reader.read_leads(sources=spec))
+        return run
+    return setup
+
+
+def _stats_overview(n_rows: int):
+    def setup(ctx: BenchContext, stack: ExitStack):
+        from app import models
+        _seed_leads(_temp_db(ctx, stack, f"stats_{n_rows}.sqlite"), n_rows)
+        models.dedup_leads()
+
+        def run():
+            return models.stats_overview("2025-03-01", "2025-10-31")
+        return run
+    return setup
+
+
+def _dedup_leads(n_rows: int):
+    """Пакетная дедупликация истории (нормализация телефонов + разметка дублей)."""
+    def setup(ctx: BenchContext, stack: ExitStack):
+        from app import models
+        _seed_leads(_temp_db(ctx, stack, f"dedup_{n_rows}.sqlite"), n_rows)
+        return models.dedup_leads
+    return setup
+
+
+def _search_leads(n_rows: int):
+    """FTS5-поиск по заявкам: префиксы + слово с опечаткой, первая страница."""
+    def setup(ctx: BenchContext, stack: ExitStack):
+        from app import models
+        _seed_leads(_temp_db(ctx, stack, f"search_{n_rows}.sqlite"), n_rows)
+
+        def run():
+            return models.search_leads("анна перезв окрашевание", page=2)
+        return run
+    return setup
+
+
+def _lead_capture_burst(n_leads: int):
+    """Пачка add_lead при включённой дозаписи в Sheets: HTTP-обработчик не должен ждать Sheets API."""
+    def setup(ctx: BenchContext, stack: ExitStack):
+        from app import models
+        from app.sheets_sync import SheetsWriteBehind
+        _temp_db(ctx, stack, f"burst_{n_leads}.sqlite")
+        ws = FakeWorksheet(make_sheet_values(0), latency=ctx.sheets_latency, error_rate=ctx.error_rate)
+        writer = SheetsWriteBehind(interval=0.5, batch_size=50, open_ws=lambda: ws)
+        models.subscribe_outbox(writer.notify)
+        writer.start()
+        stack.callback(models.unsubscribe_outbox, writer.notify)
+        stack.callback(writer.stop)
+
+        def run():
+            for i in range(n_leads):
+                models.add_lead(f"Клиент {i}", f"8900{i:07d}", "Стрижка", "burst")
+        return run
+    return setup
+
+
+def _vk_upload_photos(n_photos: int):
+    def setup(ctx: BenchContext, stack: ExitStack):
+        from social_publishers.vk_publisher import VKPublisher
+        paths = []
+        for i in range(n_photos):
+            p = os.path.join(ctx.workdir, f"photo_{i}.png")
+            with open(p, "wb") as f:
+                f.write(TINY_PNG)
+            paths.append(p)
+        pub = VKPublisher(vk_api_key="vk-bench", group_id=1, api_base=ctx.stub.vk_api_base,
+                          retry_backoff_sec=0.01)
+
+        def run():
+            return pub.upload_photos(paths)
+        return run
+    return setup
+
+
+def _post_generator_flow(ctx: BenchContext, stack: ExitStack):
+    client = _logged_in_client(ctx, stack, "flow.sqlite")
+    form = {"tone": "позитивный", "topic": "Осенние скидки", "gen_image": "on", "autopost_vk": "on"}
+
+    def run():
+        resp = client.post("/post-generator", data=form)
+        if resp.status_code != 200:
+            raise RuntimeError(f"/post-generator -> HTTP {resp.status_code}")
+        return resp
+    return run
+
+
+def _post_generator_stream_first_token(ctx: BenchContext, stack: ExitStack):
+    """Время до первого token-события SSE (time-to-first-content)."""
+    client = _logged_in_client(ctx, stack, "stream.sqlite")
+    form = {"tone": "позитивный", "topic": "Осенние скидки", "gen_image": "on", "autopost_vk": "on"}
+
+    def run():
+        job = client.post("/post-generator/stream", data=form).get_json()
+        resp = client.get(job["url"], buffered=False)
+        try:
+            for chunk in resp.response:
+                if chunk.startswith(b"event: token"):
+                    return chunk
+                if chunk.startswith(b"event: error"):
+                    raise RuntimeError(chunk.decode("utf-8"))
+            raise RuntimeError("поток завершился без token-событий")
+        finally:
+            resp.close()
+    return run
+
+
+_BOOT_SNIPPET = "import time; t = time.perf_counter(); import run; print(time.perf_counter() - t)"
+
+
+def _app_boot(ctx: BenchContext, stack: ExitStack):
+    """Холодный импорт run.py (create_app) в чистом процессе — как старт воркера на PythonAnywhere."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def run():
+        out = subprocess.run([sys.executable, "-c", _BOOT_SNIPPET], cwd=root,
+                             capture_output=True, text=True, check=True)
+        return float(out.stdout.strip().splitlines()[-1])
+    return run
+
+
+def _campaign(n_rows: int):
+    """Пакетная кампания через три стадии (текст/картинка/VK) без лимита rps — накладные расходы конвейера."""
+    def setup(ctx: BenchContext, stack: ExitStack):
+        import campaign
+        path = os.path.join(ctx.workdir, f"campaign_{n_rows}.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write("topic,tone,groups\n")
+            for i in range(n_rows):
+                f.write(f"Тема {i},позитивный,1\n")
+
+        def run():
+            cp = campaign.checkpoint_path(path)
+            if os.path.exists(cp):
+                os.remove(cp)  # каждый прогон — с нуля, а не продолжение
+            res = campaign.run_campaign(path, vk_rps=0, image_dir=os.path.join(ctx.workdir, "campaign_img"))
+            if res["failed"]:
+                raise RuntimeError(f"кампания: {res['failed']} строк с ошибкой")
+            return res
+        return run
+    return setup
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("app_boot", _app_boot, repeat=5, self_timed=True),
+    Scenario("sheets_summary_1k", _sheets_summary(1_000), repeat=5),
+    Scenario("sheets_summary_100k", _sheets_summary(100_000), repeat=3),
+    Scenario("sheets_summary_1m", _sheets_summary(1_000_000), repeat=1),
+    Scenario("sheets_tab_12k", _sheets_multi_tab(1, 1, 12_000), repeat=3),
+    Scenario("sheets_tabs_12", _sheets_multi_tab(3, 4, 1_000), repeat=3),
+    Scenario("stats_overview_100k", _stats_overview(100_000), repeat=5),
+    Scenario("dedup_leads_100k", _dedup_leads(100_000), repeat=3),
+    Scenario("search_leads_100k", _search_leads(100_000), repeat=5),
+    Scenario("lead_capture_burst_200", _lead_capture_burst(200), repeat=3),
+    Scenario("vk_upload_photos_5", _vk_upload_photos(5), repeat=5),
+    Scenario("post_generator_flow", _post_generator_flow, repeat=3),
+    Scenario("post_generator_stream_ttfc", _post_generator_stream_first_token, repeat=3),
+    Scenario("campaign_100", _campaign(100), repeat=1),
+]
+
+
+# ----------------------------
+# Прогон и baseline
+# ----------------------------
+
+def run_scenario(sc: Scenario, ctx: BenchContext) -> Dict[str, Any]:
+    timings: List[float] = []
+    errors = 0
+    with ExitStack() as stack:
+        fn = sc.setup(ctx, stack)
+        for _ in range(sc.repeat):
+            t0 = time.perf_counter()
+            try:
+                res = fn()
+            except Exception as e:
+                errors += 1
+                print(f"  [{sc.name}] ошибка: {e}", file=sys.stderr)
+                continue
+            timings.append(float(res) if sc.self_timed else time.perf_counter() - t0)
+    return {
+        "median_s": round(statistics.median(timings), 6) if timings else None,
+        "min_s": round(min(timings), 6) if timings else None,
+        "runs": len(timings),
+        "errors": errors,
+    }
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(path: str, results: Dict[str, Any]) -> None:
+    payload = {
+        "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            allow_errors: bool = False) -> List[str]:
+    """
+    Печатает таблицу сравнения, возвращает имена сценариев с регрессией больше threshold.
+    Упавший сценарий — тоже регрессия; отдельные ошибки прогонов — тоже, если ошибки
+    не включены намеренно (--error-rate, allow_errors).
+    """
+    regressions = []
+    print(f"\n{'scenario':<26}{'median, s':>12}{'baseline, s':>14}{'delta':>10}")
+    for name, cur in results.items():
+        base = (baseline.get(name) or {}).get("median_s")
+        now = cur.get("median_s")
+        if now is None:
+            print(f"{name:<26}{'—':>12}{base if base is not None else '—':>14}{'FAILED':>10}")
+            regressions.append(name)
+            continue
+        if cur.get("errors") and not allow_errors:
+            print(f"{name:<26}{now:>12.4f}{base if base is not None else '—':>14}{'ERRORS':>10}")
+            regressions.append(name)
+            continue
+        if not base:
+            print(f"{name:<26}{now:>12.4f}{'—':>14}{'':>10}")
+            continue
+        delta = now / base - 1.0
+        mark = " !" if delta > threshold else ""
+        print(f"{name:<26}{now:>12.4f}{base:>14.4f}{delta:>+9.0%}{mark}")
+        if delta > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки ZeroSMM (stub OpenAI/VK/Sheets)")
+    parser.add_argument("-k", dest="pattern", help="запускать только сценарии, содержащие подстроку")
+    parser.add_argument("--list", action="store_true", help="показать сценарии и выйти")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="путь к baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление (0.25 = +25%%)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ошибок внешних API (0..1)")
+    parser.add_argument("--sheets-latency", type=float, default=0.2, help="задержка get_all_values, сек")
+    args = parser.parse_args(argv)
+
+    selected = [s for s in SCENARIOS if not args.pattern or args.pattern in s.name]
+    if args.list:
+        for s in selected:
+            print(s.name)
+        return 0
+
+    results: Dict[str, Any] = {}
+    workdir = tempfile.mkdtemp(prefix="zerosmm-bench-")
+    try:
+        with StubServer(error_rate=args.error_rate) as stub, _stub_env(stub):
+            ctx = BenchContext(stub, workdir, args.sheets_latency, args.error_rate)
+            for sc in selected:
+                print(f"> {sc.name} (x{sc.repeat})", flush=True)
+                results[sc.name] = run_scenario(sc, ctx)
+            print(f"stub: запросов {sum(stub.hits.values())}, ошибок {stub.errors}")
+            import clients
+            for transport, st in clients.http_stats().items():
+                print(f"pool[{transport}]: запросов {st['requests']}, соединений {st['connections']}, "
+                      f"reuse {st['reuse_rate']:.0%}, сэкономлено рукопожатий {st['handshakes_saved']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.threshold, allow_errors=args.error_rate > 0)
+
+    if args.save_baseline:
+        # упавшие сценарии в baseline не пишем — иначе потеряем прошлое рабочее значение
+        ok = {name: r for name, r in results.items() if r.get("median_s") is not None}
+        save_baseline(args.baseline, {**baseline, **ok})
+        print(f"\nbaseline сохранён: {args.baseline}")
+        failed = sorted(set(results) - set(ok))
+        if failed:
+            print(f"не сохранены (упали): {', '.join(failed)}")
+            return 1
+        return 0
+    if regressions:
+        print(f"\nрегрессии (> {args.threshold:.0%}): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+# benchmarks/stubs.py — локальные заменители внешних API
+import base64
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+# PNG 1x1 — достаточно, чтобы пройти сохранение файла и загрузку в VK
+TINY_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+STUB_POST_TEXT = (
+    "Солнечный луч — это тепло и забота каждый день. "
+    "Приходите к нам за хорошим настроением и отличным сервисом! "
+) * 8
+
+# Задержки по умолчанию (сек) — порядок величин реальных API, ужатый в разы
+DEFAULT_LATENCY = {
+    "chat": 0.05,        # для stream=True — время до первого токена
+    "chat_token": 0.005, # пауза между кусками потокового ответа
+    "images": 0.10,
+    "vk_method": 0.02,
+    "vk_upload": 0.04,
+}
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # клиент закрыл поток на середине (замер до первого токена) — это не ошибка стаба
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class StubServer:
+    """
+    HTTP-сервер в отдельном потоке, отвечающий как OpenAI (chat/images) и VK API
+    (photos.getWallUploadServer -> upload -> photos.saveWallPhoto -> wall.post).
+
+    latency    — задержка ответа по типу маршрута (см. DEFAULT_LATENCY)
+    error_rate — доля запросов, на которые вернётся HTTP 500
+    """
+
+    def __init__(self, latency: Optional[Dict[str, float]] = None, error_rate: float = 0.0, seed: int = 42):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.error_rate = error_rate
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.hits: Dict[str, int] = {}
+        self.errors = 0
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ----------------------- lifecycle -----------------------
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def vk_api_base(self) -> str:
+        return f"{self.base_url}/method"
+
+    def start(self) -> "StubServer":
+        stub = self
+
+        class Handler(_StubHandler):
+            server_stub = stub
+
+        self._httpd = _QuietHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ----------------------- helpers -----------------------
+
+    def _next_id(self) -> int:
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    def _hit(self, route: str) -> bool:
+        """Учитывает запрос, выдерживает задержку; True — нужно вернуть ошибку."""
+        with self._lock:
+            self.hits[route] = self.hits.get(route, 0) + 1
+            fail = self.error_rate > 0 and self._rnd.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        kind = "vk_method" if route.startswith("vk:") else route
+        time.sleep(self.latency.get(kind, 0.0))
+        return fail
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящих API
+    disable_nagle_algorithm = True  # иначе мелкие ответы ждут delayed ACK и искажают замеры
+    server_stub: StubServer = None
+
+    def log_message(self, fmt, *args):  # не шумим в stdout
+        pass
+
+    def _read_body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def _send_json(self, payload, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fail(self) -> None:
+        self._send_json({"error": {"message": "stub: simulated server error"}}, status=500)
+
+    def do_GET(self):
+        self._dispatch("GET", b"")
+
+    def do_POST(self):
+        self._dispatch("POST", self._read_body())
+
+    def _dispatch(self, method: str, body: bytes) -> None:
+        stub = self.server_stub
+        path = urlparse(self.path).path
+
+        if path == "/v1/chat/completions":
+            if stub._hit("chat"):
+                return self._fail()
+            return self._chat(json.loads(body or b"{}"))
+
+        if path == "/v1/images/generations":
+            if stub._hit("images"):
+                return self._fail()
+            return self._images()
+
+        if path == "/upload":
+            if stub._hit("vk_upload"):
+                return self._fail()
+            return self._send_json({"server": 1, "photo": "[{\"photo\":\"stub\"}]", "hash": "stubhash"})
+
+        if path.startswith("/method/"):
+            name = path[len("/method/"):]
+            if stub._hit(f"vk:{name}"):
+                return self._fail()
+            return self._vk_method(name)
+
+        self._send_json({"error": {"message": f"stub: unknown route {method} {path}"}}, status=404)
+
+    # ----------------------- OpenAI -----------------------
+
+    def _chat(self, req: dict) -> None:
+        stub = self.server_stub
+        if req.get("stream"):
+            return self._chat_stream(req)
+        self._send_json({
+            "id": f"chatcmpl-stub-{stub._next_id()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "gpt-4"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_POST_TEXT},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 20, "completion_tokens": 200, "total_tokens": 220},
+        })
+
+    def _send_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _chat_stream(self, req: dict) -> None:
+        """stream=True: SSE с chat.completion.chunk, по слову на кусок."""
+        stub = self.server_stub
+        cid = f"chatcmpl-stub-{stub._next_id()}"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta: dict, finish_reason=None) -> bytes:
+            payload = {
+                "id": cid,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": req.get("model", "gpt-4"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        self._send_chunk(chunk({"role": "assistant", "content": ""}))
+        for word in STUB_POST_TEXT.split(" "):
+            time.sleep(stub.latency.get("chat_token", 0.0))
+            self._send_chunk(chunk({"content": word + " "}))
+        self._send_chunk(chunk({}, finish_reason="stop"))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _images(self) -> None:
+        self._send_json({
+            "created": int(time.time()),
+            "data": [{"b64_json": base64.b64encode(TINY_PNG).decode("ascii")}],
+        })
+
+    # ----------------------- VK -----------------------
+
+    def _vk_method(self, name: str) -> None:
+        stub = self.server_stub
+        if name == "photos.getWallUploadServer":
+            return self._send_json({"response": {"upload_url": f"{stub.base_url}/upload"}})
+        if name == "photos.saveWallPhoto":
+            return self._send_json({"response": [{"owner_id": -1, "id": stub._next_id()}]})
+        if name == "wall.post":
+            return self._send_json({"response": {"post_id": stub._next_id()}})
+        self._send_json({"error": {"error_code": 3, "error_msg": f"Unknown method passed: {name}"}})
+
+
+# ----------------------------
+# Google Sheets
+# ----------------------------
+
+SHEET_HEADER = ["Дата и время", "Имя", "Телефон", "Вид услуги", "Комментарий", "Источник"]
+
+_SERVICES = ["Стрижка", "Окрашивание", "Маникюр", "Педикюр", "Массаж", "Укладка", ""]
+_NAMES = ["Анна", "Мария", "Ольга", "Ирина", "Елена", "Наталья", "Светлана", "Татьяна"]
+_COMMENTS = ["", "перезвонить вечером", "первый визит", "по акции", "постоянный клиент"]
+_SOURCES = ["сайт", "vk", "солнечный луч", "telegram"]
+
+
+def make_sheet_values(n_rows: int, seed: int = 1) -> List[List[str]]:
+    """
+    Синтетическая таблица заявок в формате gspread get_all_values():
+    первая строка — заголовок, дальше n_rows строк данных.
+    """
+    rnd = random.Random(seed)
+    # набор дат/телефонов ограничен — строки переиспользуются и не раздувают память на 1M строк
+    days = [f"2025-{m:02d}-{d:02d}" for m in range(1, 13) for d in range(1, 29)]
+    stamps = [f"{day}T{h:02d}:{mi:02d}:00+03:00" for day in days for h, mi in ((10, 15), (14, 40), (18, 5))]
+    phones = [f"+7 (9{i % 100:02d}) {i % 1000:03d}-{i % 97:02d}-{i % 89:02d}" for i in range(5000)]
+    values = [list(SHEET_HEADER)]
+    for _ in range(n_rows):
+        values.append([
+            rnd.choice(stamps),
+            rnd.choice(_NAMES),
+            rnd.choice(phones),
+            rnd.choice(_SERVICES),
+            rnd.choice(_COMMENTS),
+            rnd.choice(_SOURCES),
+        ])
+    return values
+
+
+class _FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+class FakeQuotaError(Exception):
+    """Как gspread.exceptions.APIError при превышении квоты: e.response.status_code == 429."""
+
+    def __init__(self):
+        super().__init__("stub: Quota exceeded for quota metric 'Write requests'")
+        self.response = _FakeResponse(429)
+
+
+class FakeWorksheet:
+    """
+    Заменитель gspread.Worksheet: get_all_values()/row_values()/append_rows() с задержкой.
+    error_rate — доля ошибок: для чтения RuntimeError, для записи — ошибка квоты (429).
+    """
+
+    def __init__(self, values: List[List[str]], latency: float = 0.2, error_rate: float = 0.0, seed: int = 7):
+        self.values = values
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.append_calls = 0
+
+    def get_all_values(self) -> List[List[str]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.error_rate > 0 and self._rnd.random() < self.error_rate:
+            raise RuntimeError("stub: simulated Sheets API error")
+        return self.values
+
+    def row_values(self, row: int) -> List[str]:
+        return list(self.values[row - 1]) if len(self.values) >= row else []
+
+    def append_rows(self, rows: List[List[str]], value_input_option: str = "RAW", **kwargs) -> None:
+        time.sleep(self.latency)
+        with self._lock:
+            self.append_calls += 1
+            if self.error_rate > 0 and self._rnd.random() < self.error_rate:
+                raise FakeQuotaError()
+            self.values.extend(rows)
+
+
+class FakeSpreadsheet:
+    """
+    Заменитель gspread.Spreadsheet. Каждый «запрос» к API ждёт latency:
+    open() (метаданные, как open_by_key), fetch_sheet_metadata()/worksheets() и values_batch_get().
+    Счётчик api_calls показывает, сколько запросов сделано.
+    """
+
+    def __init__(self, title: str, tabs: Dict[str, List[List[str]]], latency: float = 0.2, error_rate: float = 0.0):
+        self.title = title
+        self.tabs = tabs
+        self.latency = latency
+        self.error_rate = error_rate
+        self._ws = {t: FakeWorksheet(v, latency=latency, error_rate=error_rate) for t, v in tabs.items()}
+        for t, ws in self._ws.items():
+            ws.title = t
+        self.metadata: Optional[dict] = None
+        self.api_calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _request(self) -> None:
+        with self._calls_lock:
+            self.api_calls += 1
+        time.sleep(self.latency)
+        if self.error_rate > 0 and self.sheet1._rnd.random() < self.error_rate:
+            raise RuntimeError("stub: simulated Sheets API error")
+
+    def open(self) -> "FakeSpreadsheet":
+        """Как gc.open_by_key: один запрос метаданных, которые запоминаются в .metadata."""
+        self.metadata = self.fetch_sheet_metadata()
+        return self
+
+    @property
+    def sheet1(self) -> FakeWorksheet:
+        return next(iter(self._ws.values()))
+
+    def fetch_sheet_metadata(self, params: Optional[dict] = None) -> dict:
+        self._request()
+        return {"properties": {"title": self.title},
+                "sheets": [{"properties": {"title": t, "index": i}} for i, t in enumerate(self.tabs)]}
+
+    def worksheets(self) -> List[FakeWorksheet]:
+        self.fetch_sheet_metadata()  # как в gspread: отдельный запрос метаданных
+        return list(self._ws.values())
+
+    def values_batch_get(self, ranges: List[str], params: Optional[dict] = None) -> dict:
+        self._request()
+        out = []
+        for rng in ranges:
+            if "!" in rng or rng.startswith("'"):
+                title = rng.split("!", 1)[0].strip("'").replace("''", "'")
+            else:
+                title = next(iter(self.tabs))  # диапазон без листа — первая вкладка
+            values = self.tabs.get(title, [])
+            out.append({"range": f"'{title}'!A1:Z{len(values)}", "majorDimension": "ROWS", "values": values})
+        return {"spreadsheetId": self.title, "valueRanges": out}
@@ -0,0 +1,560 @@
+# campaign.py — пакетная кампания: CSV/JSONL с темами -> текст -> картинка -> публикация VK
+#
+# Каждая строка проходит три стадии, у каждой свой пул потоков. Между стадиями — очереди
+# ограниченного размера: если VK не успевает, генерация встаёт и не копит сотни готовых постов.
+# Прогресс пишется в <файл>.progress.jsonl; повторный запуск продолжает с места остановки
+# (готовые стадии не повторяются, упавшие строки пробуются снова).
+#
+# Локальный запуск:
+#   python campaign.py topics.csv --text-workers 8 --image-workers 4 --vk-workers 2 --vk-rps 3
+#
+# Формат входа (CSV с заголовком или JSONL), поля:
+#   topic         — тема поста (обязательно)
+#   tone          — тон (по умолчанию "нейтральный")
+#   groups        — ID групп VK через ; или пробел (по умолчанию VK_GROUP_ID)
+#   publish_date  — отложенная публикация: ISO дата/время или unix timestamp (необязательно)
+import csv
+import hashlib
+import json
+import os
+import queue
+import re
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv() or ".env")
+
+STAGES = ("text", "image", "publish")
+_STOP = object()  # сигнал воркерам стадии: входная очередь закончилась
+
+
+# ----------------------------
+# Вход и чекпоинт
+# ----------------------------
+
+def _parse_groups(raw: Any) -> List[int]:
+    if isinstance(raw, (list, tuple)):
+        items = raw
+    else:
+        items = re.split(r"[;,\s]+", str(raw or "").strip())
+    return [abs(int(g)) for g in items if str(g).strip().lstrip("-").isdigit()]
+
+
+def _parse_publish_date(raw: Any) -> Optional[int]:
+    if raw in (None, ""):
+        return None
+    s = str(raw).strip()
+    if s.isdigit():
+        return int(s)
+    try:
+        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"publish_date: не дата и не unix timestamp: {s!r}") from None
+    if dt.tzinfo is None:
+        dt = dt.astimezone()  # локальное время сервера
+    return int(dt.timestamp())
+
+
+def _row_key(n: int, parts: Any) -> str:
+    digest = hashlib.sha1(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()[:10]
+    return f"{n}:{digest}"
+
+
+def _iter_records(f, jsonl: bool) -> Iterator[Any]:
+    """Сырые записи файла; битая строка JSONL отдаётся как исключение, а не обрывает чтение."""
+    if not jsonl:
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"не JSON: {e}")
+
+
+def read_campaign(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково читает CSV/JSONL и отдаёт строки с ключом key (стабилен между запусками).
+    Строка, которую не удалось разобрать, отдаётся с полем error (и без темы) — кампания
+    не останавливается из-за одной плохой строки.
+    """
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        records = _iter_records(f, path.lower().endswith((".jsonl", ".ndjson")))
+        for n, rec in enumerate(records, start=1):
+            try:
+                if isinstance(rec, Exception):
+                    raise rec
+                if not isinstance(rec, dict):
+                    raise ValueError("ожидался объект с полями topic, tone, groups, publish_date")
+                rec = {(k or "").strip().lower(): v for k, v in rec.items()}
+                topic = str(rec.get("topic") or "").strip()
+                if not topic:
+                    continue
+                row = {
+                    "n": n,
+                    "topic": topic,
+                    "tone": str(rec.get("tone") or "").strip() or "нейтральный",
+                    "groups": _parse_groups(rec.get("groups")),
+                    "publish_date": _parse_publish_date(rec.get("publish_date")),
+                }
+            except (TypeError, ValueError) as e:
+                yield {"n": n, "key": _row_key(n, ["invalid", repr(rec)]), "error": f"строка {n}: {e}"}
+                continue
+            row["key"] = _row_key(n, [row["topic"], row["tone"], row["groups"], row["publish_date"]])
+            yield row
+
+
+class Checkpoint:
+    """Журнал прогресса (JSONL, только дозапись): одна запись на завершённую стадию строки или ошибку."""
+
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state: Dict[str, Dict[str, Any]] = {}
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # недописанная строка после падения
+                    self._apply(rec)
+        self._f = None if readonly else open(path, "a", encoding="utf-8")
+
+    def _apply(self, rec: Dict[str, Any]) -> None:
+        st = self.state.setdefault(rec["key"], {})
+        if rec["stage"] == "error":
+            st["error"] = rec.get("error")
+        else:
+            st.pop("error", None)
+            st[rec["stage"]] = rec.get("data") or {}
+
+    def record(self, key: str, stage: str, data: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        rec = {"key": key, "stage": stage, "ts": int(time.time())}
+        if data is not None:
+            rec["data"] = data
+        if error is not None:
+            rec["error"] = error
+        line = json.dumps(rec, ensure_ascii=False)
+        with self._lock:
+            self._apply(rec)
+            self._f.write(line + "\n")
+            self._f.flush()
+
+    def done(self, key: str, stage: str) -> Optional[Dict[str, Any]]:
+        return self.state.get(key, {}).get(stage)
+
+    def summary(self) -> Dict[str, int]:
+        out = {stage: 0 for stage in STAGES}
+        out["failed"] = 0
+        for st in self.state.values():
+            for stage in STAGES:
+                if stage in st and not st[stage].get("partial"):
+                    out[stage] += 1
+            if st.get("error"):
+                out["failed"] += 1
+        return out
+
+    def close(self) -> None:
+        if self._f:
+            self._f.close()
+
+
+def checkpoint_path(path: str) -> str:
+    return f"{path}.progress.jsonl"
+
+
+def validate_campaign(path: str, max_errors: int = 5) -> Tuple[int, List[str]]:
+    """Проверка файла перед запуском: (число строк с темой, первые max_errors ошибок разбора)."""
+    rows, errors = 0, []
+    try:
+        for row in read_campaign(path):
+            if row.get("error"):
+                if len(errors) < max_errors:
+                    errors.append(row["error"])
+            else:
+                rows += 1
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        errors.append(f"файл не читается: {e}")
+    return rows, errors
+
+
+def progress(path: str) -> Dict[str, int]:
+    """
+    Сводка по кампании из чекпоинта (для страницы прогресса): total, invalid (строки,
+    которые не разобрать) и счётчики стадий. Плохой файл не роняет страницу — считаем, что успели.
+    """
+    out = Checkpoint(checkpoint_path(path), readonly=True).summary()
+    out["total"] = out["invalid"] = 0
+    try:
+        for row in read_campaign(path):
+            out["total"] += 1
+            if row.get("error"):
+                out["invalid"] += 1
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        print(f"[Campaign] {path}: {e}")
+    return out
+
+
+class CampaignBusy(RuntimeError):
+    """Кампания уже выполняется (в этом или другом процессе)."""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # процесс есть, просто чужой
+    return True
+
+
+class CampaignLock:
+    """
+    Межпроцессная блокировка кампании: файл <путь>.lock, создаётся через O_EXCL.
+    Держит её тот, кто выполняет кампанию, — второй воркер сервера или CLI не запустит
+    ещё один прогон по тому же чекпоинту (иначе посты уйдут в VK дважды).
+    Блокировка умершего процесса на этой же машине считается протухшей и снимается.
+    """
+
+    def __init__(self, path: str):
+        self.path = f"{path}.lock"
+        self.held = False
+
+    def _owner(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # файла нет или его как раз пишут
+
+    def is_stale(self) -> bool:
+        owner = self._owner()
+        if not owner or owner.get("host") != socket.gethostname():
+            return False  # процесс на другой машине проверить не можем — считаем живым
+        return not _pid_alive(int(owner.get("pid") or 0))
+
+    def locked(self) -> bool:
+        return os.path.exists(self.path) and not self.is_stale()
+
+    def acquire(self) -> bool:
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self.is_stale():
+                    return False
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"pid": os.getpid(), "host": socket.gethostname(), "ts": int(time.time())}, f)
+            self.held = True
+            return True
+        return False
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def is_running(path: str) -> bool:
+    """Выполняется ли кампания сейчас в каком-нибудь процессе."""
+    return CampaignLock(path).locked()
+
+
+# ----------------------------
+# Конвейер
+# ----------------------------
+
+class RateLimiter:
+    """Не чаще rps вызовов в секунду на всю стадию (VK: ~3 запроса/сек на токен)."""
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps and rps > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class _Stage:
+    def __init__(self, name: str, workers: int, fn: Callable[[Dict[str, Any]], bool],
+                 inbox: "queue.Queue", outbox: Optional["queue.Queue"],
+                 on_error: Callable[[Dict[str, Any], str, Exception], bool]):
+        self.name = name
+        self.fn = fn
+        self.on_error = on_error
+        self.inbox = inbox
+        self.outbox = outbox
+        self.threads = [
+            threading.Thread(target=self._work, name=f"campaign-{name}-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+
+    def start(self) -> None:
+        for t in self.threads:
+            t.start()
+
+    def _work(self) -> None:
+        while True:
+            row = self.inbox.get()
+            if row is _STOP:
+                return
+            try:
+                ok = self.fn(row)
+            except Exception as e:
+                # неожиданная ошибка не должна убивать воркер: иначе стадия встанет,
+                # а предыдущая навсегда заблокируется на полной очереди
+                ok = self.on_error(row, self.name, e)
+            if ok and self.outbox is not None:
+                self.outbox.put(row)  # блокируется, если следующая стадия не успевает
+
+    def stop(self) -> None:
+        """Дождаться, пока воркеры разберут входную очередь, и завершить их."""
+        for _ in self.threads:
+            self.inbox.put(_STOP)
+        for t in self.threads:
+            t.join()
+
+
+class CampaignRunner:
+    def __init__(
+        self,
+        path: str,
+        openai_key: Optional[str] = None,
+        vk_api_key: Optional[str] = None,
+        default_group: Optional[int] = None,
+        text_workers: int = 8,
+        image_workers: int = 4,
+        vk_workers: int = 2,
+        queue_size: int = 16,
+        vk_rps: float = 3.0,
+        images: bool = True,
+        image_dir: str = "generated_images",
+        progress: Optional[Callable[[Dict[str, int]], None]] = None,
+        lock: Optional[CampaignLock] = None,
+    ):
+        self.path = path
+        self.openai_key = openai_key or os.getenv("OPENAI_API_KEY", "")
+        self.vk_api_key = vk_api_key or os.getenv("VK_API_KEY", "")
+        group = default_group or os.getenv("VK_GROUP_ID")
+        self.default_groups = [int(group)] if group and str(group).isdigit() else []
+        self.workers = {"text": text_workers, "image": image_workers if images else 0, "publish": vk_workers}
+        self.queue_size = queue_size
+        self.images = images
+        self.image_dir = image_dir
+        self.vk_limiter = RateLimiter(vk_rps)
+        self.progress = progress
+        self.lock = lock or CampaignLock(path)  # можно передать уже взятую блокировку
+        self.checkpoint: Optional[Checkpoint] = None
+        self.counts = {"total": 0, "skipped": 0, "text": 0, "image": 0, "published": 0, "failed": 0}
+        self._counts_lock = threading.Lock()
+
+    def _inc(self, key: str) -> None:
+        with self._counts_lock:
+            self.counts[key] += 1
+            snapshot = dict(self.counts)
+        if self.progress:
+            try:
+                self.progress(snapshot)
+            except Exception as e:
+                print(f"[Campaign] ошибка в обработчике прогресса: {e}")
+
+    def _fail(self, row: Dict[str, Any], stage: str, e: Exception) -> bool:
+        try:
+            self.checkpoint.record(row["key"], "error", error=f"{stage}: {e}")
+        except Exception as rec_err:
+            print(f"[Campaign] не удалось записать ошибку в чекпоинт: {rec_err}")
+        self._inc("failed")
+        print(f"[Campaign] строка {row['n']} ({stage}): {e}")
+        return False
+
+    # ----------------------- стадии -----------------------
+
+    def _text(self, row: Dict[str, Any]) -> bool:
+        done = self.checkpoint.done(row["key"], "text")
+        if done is None:
+            try:
+                from generators.text_gen import PostGenerator
+                pg = PostGenerator(openai_key=self.openai_key, tone=row["tone"], topic=row["topic"])
+                done = {"text": pg.generate_post()}
+            except Exception as e:
+                return self._fail(row, "text", e)
+            self.checkpoint.record(row["key"], "text", done)
+            self._inc("text")
+        row["text"] = done["text"]
+        return True
+
+    def _image(self, row: Dict[str, Any]) -> bool:
+        done = self.checkpoint.done(row["key"], "image")
+        if done is None:
+            try:
+                from generators.text_gen import PostGenerator
+                from generators.image_gen import ImageGenerator
+                prompt = PostGenerator(self.openai_key, row["tone"], row["topic"]).generate_post_image_description()
+                path = ImageGenerator(openai_key=self.openai_key, out_dir=self.image_dir).generate_image(prompt)
+                if not path:
+                    raise RuntimeError("изображение не сгенерировано")
+                done = {"image_path": path}
+            except Exception as e:
+                return self._fail(row, "image", e)
+            self.checkpoint.record(row["key"], "image", done)
+            self._inc("image")
+        row["image_path"] = done["image_path"]
+        return True
+
+    def _publish(self, row: Dict[str, Any]) -> bool:
+        from social_publishers.vk_publisher import VKPublisher
+        done = self.checkpoint.done(row["key"], "publish") or {"posts": {}}
+        posts = dict(done.get("posts") or {})
+        groups = row["groups"] or self.default_groups
+        if not groups:
+            return self._fail(row, "publish", RuntimeError("не указаны группы и не задан VK_GROUP_ID"))
+        extra = {"publish_date": row["publish_date"]} if row["publish_date"] else {}
+        for gid in groups:
+            if str(gid) in posts:
+                continue  # в эту группу уже опубликовано в прошлом запуске
+            try:
+                pub = VKPublisher(vk_api_key=self.vk_api_key, group_id=gid)
+                # upload_photo = 2 вызова API + загрузка, wall.post = ещё один
+                for _ in range(3 if row.get("image_path") else 1):
+                    self.vk_limiter.wait()
+                res = pub.publish_post(row["text"], image_path=row.get("image_path"), **extra)
+            except Exception as e:
+                if posts:  # частичный успех тоже сохраняем — повтор не задублирует пост
+                    self.checkpoint.record(row["key"], "publish", {"posts": posts, "partial": True})
+                return self._fail(row, "publish", e)
+            posts[str(gid)] = res.get("permalink")
+        self.checkpoint.record(row["key"], "publish", {"posts": posts})
+        self._inc("published")
+        return True
+
+    # ----------------------- запуск -----------------------
+
+    def _pending_rows(self) -> Iterator[Dict[str, Any]]:
+        for row in read_campaign(self.path):
+            st = self.checkpoint.state.get(row["key"], {})
+            with self._counts_lock:
+                self.counts["total"] += 1
+            if row.get("error"):
+                # строку не разобрать — отмечаем ошибку и идём дальше
+                if st.get("error") != row["error"]:
+                    self.checkpoint.record(row["key"], "error", error=row["error"])
+                self._inc("failed")
+                print(f"[Campaign] {row['error']}")
+                continue
+            if "publish" in st and not st["publish"].get("partial"):
+                self._inc("skipped")
+                continue
+            yield row
+
+    def run(self) -> Dict[str, int]:
+        if not self.lock.held and not self.lock.acquire():
+            raise CampaignBusy(f"кампания {self.path} уже выполняется")
+        try:
+            return self._run()
+        finally:
+            self.lock.release()
+
+    def _run(self) -> Dict[str, int]:
+        if not self.openai_key:
+            raise RuntimeError("OPENAI_API_KEY не задан в .env")
+        if not self.vk_api_key:
+            raise RuntimeError("VK_API_KEY не задан в .env")
+        os.makedirs(self.image_dir, exist_ok=True)
+        self.checkpoint = Checkpoint(checkpoint_path(self.path))
+        stages: List[_Stage] = []
+        try:
+            q_text = queue.Queue(maxsize=self.queue_size)
+            q_image = queue.Queue(maxsize=self.queue_size) if self.images else None
+            q_publish = queue.Queue(maxsize=self.queue_size)
+
+            stages.append(_Stage("text", self.workers["text"], self._text, q_text, q_image or q_publish, self._fail))
+            if self.images:
+                stages.append(_Stage("image", self.workers["image"], self._image, q_image, q_publish, self._fail))
+            stages.append(_Stage("publish", self.workers["publish"], self._publish, q_publish, None, self._fail))
+            for st in stages:
+                st.start()
+
+            for row in self._pending_rows():
+                q_text.put(row)  # блокируется, когда генерация текста не успевает — файл читается лениво
+        finally:
+            # останавливаем стадии по порядку: следующая гасится только когда предыдущая всё отдала;
+            # чекпоинт закрываем только после этого — иначе воркеры пишут в закрытый файл
+            try:
+                for st in stages:
+                    st.stop()
+            finally:
+                self.checkpoint.close()
+        return dict(self.counts)
+
+
+def run_campaign(path: str, **kwargs) -> Dict[str, int]:
+    return CampaignRunner(path, **kwargs).run()
+
+
+# Локальный запуск: python campaign.py topics.csv
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Пакетная генерация и публикация постов в VK")
+    parser.add_argument("path", help="CSV или JSONL с колонками topic, tone, groups, publish_date")
+    parser.add_argument("--text-workers", type=int, default=8)
+    parser.add_argument("--image-workers", type=int, default=4)
+    parser.add_argument("--vk-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=16, help="размер очереди между стадиями")
+    parser.add_argument("--vk-rps", type=float, default=3.0, help="лимит запросов к VK в секунду")
+    parser.add_argument("--no-images", action="store_true", help="публиковать без картинок")
+    parser.add_argument("--image-dir", default=os.getenv("IMAGE_OUT_DIR", "generated_images"))
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    last = [0.0]
+
+    def report(c: Dict[str, int]) -> None:
+        now = time.perf_counter()
+        if now - last[0] >= 2:
+            last[0] = now
+            print(f"[{now - t0:6.1f}s] текст {c['text']}, картинки {c['image']}, "
+                  f"опубликовано {c['published']}, ошибок {c['failed']}, пропущено {c['skipped']}")
+
+    try:
+        result = run_campaign(
+            args.path,
+            text_workers=args.text_workers,
+            image_workers=args.image_workers,
+            vk_workers=args.vk_workers,
+            queue_size=args.queue_size,
+            vk_rps=args.vk_rps,
+            images=not args.no_images,
+            image_dir=args.image_dir,
+            progress=report,
+        )
+    except CampaignBusy as e:
+        raise SystemExit(f"[Campaign] {e}")
+    print(f"готово за {time.perf_counter() - t0:.1f}s: {result}")
@@ -0,0 +1,251 @@
+# clients.py — ленивый реестр клиентов внешних интеграций
+#
+# Модули регистрируют фабрику клиента при импорте (это дёшево),
+# а сам клиент создаётся при первом get() — не на старте приложения.
+import os
+import threading
+from typing import Any, Callable, Dict
+
+_factories: Dict[str, Callable[[], Any]] = {}
+_instances: Dict[str, Any] = {}
+_lock = threading.RLock()  # RLock: фабрика может брать из реестра другие клиенты
+
+
+def register(name: str, factory: Callable[[], Any]) -> None:
+    """Регистрирует фабрику клиента. Повторная регистрация сбрасывает уже созданный экземпляр."""
+    with _lock:
+        _factories[name] = factory
+        _instances.pop(name, None)
+
+
+def get(name: str) -> Any:
+    """Возвращает клиент, создавая его при первом обращении (потокобезопасно)."""
+    inst = _instances.get(name)
+    if inst is not None:
+        return inst
+    with _lock:
+        inst = _instances.get(name)
+        if inst is None:
+            factory = _factories.get(name)
+            if factory is None:
+                raise KeyError(f"Клиент '{name}' не зарегистрирован")
+            inst = factory()
+            _instances[name] = inst
+        return inst
+
+
+def is_ready(name: str) -> bool:
+    """Создан ли уже клиент (без побочного эффекта создания)."""
+    return name in _instances
+
+
+def reset(name: str = None) -> None:
+    """Забывает созданные клиенты (все или один) — следующий get() создаст заново."""
+    with _lock:
+        if name is None:
+            _instances.clear()
+            _openai_clients.clear()
+        else:
+            _instances.pop(name, None)
+
+
+# ----------------------------
+# Общий пул исходящих HTTP-соединений
+# ----------------------------
+#
+# Один keep-alive пул на процесс вместо нового Session/OpenAI-клиента на каждый запрос:
+# TLS-рукопожатие с api.vk.com, upload-хостами, OpenAI и Google делается один раз.
+#
+# Настройки (env):
+#   HTTP_POOL_CONNECTIONS — сколько хостов держать в пуле (requests/urllib3), по умолчанию 10
+#   HTTP_POOL_MAXSIZE     — лимит keep-alive соединений на один хост, по умолчанию 10
+#   HTTP_POOL_BLOCK       — 1: при исчерпании лимита ждать соединение, а не открывать лишнее
+#   HTTP_TIMEOUT          — таймаут запросов VK/Sheets/скачивания картинок, сек (30)
+#   OPENAI_TIMEOUT        — таймаут запросов к OpenAI, сек (600)
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def pool_config() -> Dict[str, Any]:
+    return {
+        "pool_connections": _env_int("HTTP_POOL_CONNECTIONS", 10),
+        "pool_maxsize": _env_int("HTTP_POOL_MAXSIZE", 10),
+        "pool_block": os.getenv("HTTP_POOL_BLOCK", "0") in ("1", "true", "yes"),
+        "timeout": _env_float("HTTP_TIMEOUT", 30),
+        "openai_timeout": _env_float("OPENAI_TIMEOUT", 600),
+    }
+
+
+def http_timeout() -> float:
+    return pool_config()["timeout"]
+
+
+# Счётчики: requests — VK/Sheets/скачивание, openai — httpx-клиент OpenAI
+_stats: Dict[str, Dict[str, int]] = {
+    "requests": {"requests": 0, "connections": 0, "tls_handshakes": 0},
+    "openai": {"requests": 0, "connections": 0, "tls_handshakes": 0},
+}
+_stats_lock = threading.Lock()
+
+
+def _count(transport: str, key: str) -> None:
+    with _stats_lock:
+        _stats[transport][key] += 1
+
+
+def http_stats() -> Dict[str, Any]:
+    """
+    Метрики пула по транспортам:
+      requests          — отправлено запросов
+      connections       — открыто новых соединений
+      tls_handshakes    — из них с TLS
+      reuse_rate        — доля запросов, ушедших по уже открытому соединению
+      handshakes_saved  — сколько соединений/рукопожатий не понадобилось благодаря keep-alive
+    """
+    with _stats_lock:
+        snapshot = {k: dict(v) for k, v in _stats.items()}
+    for s in snapshot.values():
+        reused = max(s["requests"] - s["connections"], 0)
+        s["handshakes_saved"] = reused
+        s["reuse_rate"] = round(reused / s["requests"], 4) if s["requests"] else 0.0
+    return snapshot
+
+
+def reset_http_stats() -> None:
+    with _stats_lock:
+        for s in _stats.values():
+            for k in s:
+                s[k] = 0
+
+
+_counting_classes: Dict[Any, Any] = {}
+
+
+def _counting_pool(base):
+    """Подкласс пула urllib3, который считает новые соединения (и TLS, если пул HTTPS)."""
+    cls = _counting_classes.get(base)
+    if cls is None:
+        from urllib3.connectionpool import HTTPSConnectionPool
+        tls = issubclass(base, HTTPSConnectionPool)
+
+        class _CountingPool(base):
+            def _new_conn(self):
+                _count("requests", "connections")
+                if tls:
+                    _count("requests", "tls_handshakes")
+                return super()._new_conn()
+
+        cls = _counting_classes[base] = _CountingPool
+    return cls
+
+
+def _install_counting(manager):
+    # и для обычного PoolManager, и для ProxyManager/SOCKSProxyManager (HTTP(S)_PROXY):
+    # подменяем их собственные классы пулов считающими подклассами
+    if not getattr(manager, "_zerosmm_counting", False):
+        manager.pool_classes_by_scheme = {
+            scheme: _counting_pool(base) for scheme, base in manager.pool_classes_by_scheme.items()
+        }
+        manager._zerosmm_counting = True
+    return manager
+
+
+def _make_http_adapter():
+    from requests.adapters import HTTPAdapter
+
+    class _PooledAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            _install_counting(self.poolmanager)
+
+        def proxy_manager_for(self, proxy, **proxy_kwargs):
+            # через прокси (PythonAnywhere free) requests ходит не через poolmanager
+            return _install_counting(super().proxy_manager_for(proxy, **proxy_kwargs))
+
+        def send(self, request, **kwargs):
+            _count("requests", "requests")
+            return super().send(request, **kwargs)
+
+    cfg = pool_config()
+    return _PooledAdapter(
+        pool_connections=cfg["pool_connections"],
+        pool_maxsize=cfg["pool_maxsize"],
+        pool_block=cfg["pool_block"],
+    )
+
+
+def _make_http_session():
+    import requests
+    sess = requests.Session()
+    adapter = get("http_adapter")
+    sess.mount("https://", adapter)
+    sess.mount("http://", adapter)
+    return sess
+
+
+def _make_openai_http_client():
+    import httpx
+    from openai import DefaultHttpxClient
+
+    def on_request(request):
+        _count("openai", "requests")
+        request.extensions["trace"] = _openai_trace
+
+    cfg = pool_config()
+    return DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=cfg["pool_maxsize"] * cfg["pool_connections"],
+                            max_keepalive_connections=cfg["pool_maxsize"]),
+        timeout=httpx.Timeout(cfg["openai_timeout"], connect=10.0),
+        event_hooks={"request": [on_request]},
+    )
+
+
+def _openai_trace(event_name: str, info: dict) -> None:
+    # httpcore сообщает о каждом новом TCP-соединении и TLS-рукопожатии
+    if event_name == "connection.connect_tcp.complete":
+        _count("openai", "connections")
+    elif event_name == "connection.start_tls.complete":
+        _count("openai", "tls_handshakes")
+
+
+register("http_adapter", _make_http_adapter)
+register("http_session", _make_http_session)
+register("openai_http", _make_openai_http_client)
+
+
+def http_adapter():
+    """Общий HTTPAdapter (пул urllib3) — можно монтировать в чужие requests.Session."""
+    return get("http_adapter")
+
+
+def http_session():
+    """Общий keep-alive requests.Session для VK и прочих HTTP-интеграций."""
+    return get("http_session")
+
+
+_openai_clients: Dict[str, Any] = {}
+
+
+def openai_client(api_key: str):
+    """OpenAI-клиент для ключа; все клиенты ходят через один httpx-пул."""
+    client = _openai_clients.get(api_key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=api_key, http_client=get("openai_http"))
+            _openai_clients[api_key] = client
+        return client
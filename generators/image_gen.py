@@ -3,13 +3,11 @@ import os
 import uuid
 import base64
 
-import requests
-import self
-from openai import OpenAI
+import clients
 
 class ImageGenerator:
     def __init__(self, openai_key, out_dir="generated_images"):
-        self.client = OpenAI(api_key=openai_key)
+        self.client = clients.openai_client(openai_key)
         self.out_dir = out_dir
         os.makedirs(self.out_dir, exist_ok=True)
 
@@ -44,9 +42,10 @@ class ImageGenerator:
             else:
                 # model == "dall-e-3" или другие — URL
                 image_url = response.data[0].url
-                # Чтобы сохранить по URL, нужно отдельно скачать:
-                # import requests
-                img_data = requests.get(image_url).content
+                # Чтобы сохранить по URL, нужно отдельно скачать (через общий keep-alive пул):
+                resp = clients.http_session().get(image_url, timeout=clients.http_timeout())
+                resp.raise_for_status()
+                img_data = resp.content
                 return self._save_png(img_data)
 
         except Exception as e:
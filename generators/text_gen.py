@@ -1,24 +1,48 @@
 # generators/text_gen.py
-from openai import OpenAI, api_key
+import clients
 
 
 class PostGenerator:
     def __init__(self, openai_key, tone, topic):
-        self.client = OpenAI(api_key=api_key)
+        self.client = clients.openai_client(openai_key)
         self.tone = tone
         self.topic = topic
 
+    def _post_messages(self):
+        return [
+            {"role": "system", "content": f"Ты копирайтер. Напиши пост в {self.tone} тоне."},
+            {"role": "user", "content": f"Создай пост на тему: {self.topic}"}
+        ]
+
     def generate_post(self):
         response = self.client.chat.completions.create(
             model="gpt-4",
-            messages=[
-                {"role": "system", "content": f"Ты копирайтер. Напиши пост в {self.tone} тоне."},
-                {"role": "user", "content": f"Создай пост на тему: {self.topic}"}
-            ],
+            messages=self._post_messages(),
             temperature=0.7,
         )
         return response.choices[0].message.content
 
+    def generate_post_stream(self):
+        """
+        То же, что generate_post, но отдаёт текст кусками по мере генерации
+        (stream=True) — не дожидаясь полного ответа модели.
+        """
+        stream = self.client.chat.completions.create(
+            model="gpt-4",
+            messages=self._post_messages(),
+            temperature=0.7,
+            stream=True,
+        )
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
     def generate_post_image_description(self):
         response = self.client.chat.completions.create(
             model="gpt-4",
@@ -0,0 +1,84 @@
+# leads_dedup.py — нормализация телефонов (E.164) и дедупликация заявок
+import hashlib
+import re
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+# Код страны по умолчанию для номеров без него (8 900 ..., 900 ...)
+DEFAULT_COUNTRY_CODE = "7"
+
+_NON_DIGITS = re.compile(r"\D+")
+
+
+@lru_cache(maxsize=65536)
+def normalize_phone(raw: Optional[str], country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """
+    Приводит телефон к E.164: "+79001234567".
+      8 (900) 123-45-67 -> +79001234567
+      900 123 45 67     -> +79001234567
+      +7 900 123-45-67  -> +79001234567
+    Возвращает None, если из строки не получается номер (пусто, слишком коротко/длинно).
+    Номера РФ/Казахстана (+7) — ровно 11 цифр: "+7 900 123-45-67 доб. 12" не номер, а номер с
+    добавочным, и склеивать его в "+7900123456712" нельзя — вызывающий код оставит исходную строку.
+    """
+    if not raw:
+        return None
+    s = str(raw).strip()
+    digits = _NON_DIGITS.sub("", s)
+    if not digits:
+        return None
+    if not s.startswith("+"):
+        if digits.startswith("00"):
+            digits = digits[2:]                      # 00 49 ... — международный префикс
+        elif country_code == "7" and digits[0] == "8" and len(digits) > 10:
+            if len(digits) != 11:
+                return None                          # 8 ... с лишними/недостающими цифрами
+            digits = "7" + digits[1:]                # 8 900 ... — внутренний формат РФ
+        elif len(digits) == 10:
+            digits = country_code + digits           # 900 123 45 67 — без кода страны
+    if digits[0] == "7" and len(digits) != 11:
+        return None                                  # +7: код страны + 10 цифр, и только так
+    if not 10 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+
+def phone_hash(e164: Optional[str]) -> Optional[str]:
+    """Короткий стабильный хэш нормализованного номера — ключ индекса дедупликации."""
+    if not e164:
+        return None
+    return hashlib.sha1(e164.encode("ascii")).hexdigest()[:16]
+
+
+class Deduplicator:
+    """
+    Потоковая дедупликация: O(1) на заявку (множество ключей в памяти).
+    Заявки без распознаваемого телефона считаются уникальными — склеить их не по чему.
+    """
+
+    def __init__(self):
+        self._first: Dict[str, Any] = {}
+        self.total = 0
+        self.unique = 0
+
+    def seen(self, raw_phone: Optional[str], ref: Any = None) -> Any:
+        """
+        Учитывает заявку. Возвращает ref первой заявки этого клиента, если это дубль,
+        иначе None (ref сохраняется как «первая» заявка клиента).
+        """
+        self.total += 1
+        key = normalize_phone(raw_phone)  # в памяти хватает самого E.164, хэш нужен только индексу БД
+        if key is None:
+            self.unique += 1
+            return None
+        first = self._first.get(key)
+        if first is not None:
+            return first
+        self._first[key] = ref if ref is not None else True
+        self.unique += 1
+        return None
+
+    @property
+    def duplicates(self) -> int:
+        return self.total - self.unique
+
@@ -1,26 +1,35 @@
 # sheets_reader.py
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
 
 from dotenv import load_dotenv, find_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
+
+import clients
+from leads_dedup import Deduplicator, normalize_phone
 
 # ----------------------------
 # ENV
 # ----------------------------
 load_dotenv(find_dotenv() or ".env")
 
-GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-SERVICE_JSON = os.getenv("GOOGLE_SERVICE_JSON", "credentials.json")
 
-if not GOOGLE_SHEET_ID:
-    raise RuntimeError("GOOGLE_SHEET_ID не задан в .env")
+def _make_gspread_client():
+    # gspread/google-auth тяжёлые — импортируем только при первом обращении к таблице
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    service_json = os.getenv("GOOGLE_SERVICE_JSON", "credentials.json")
+    creds = Credentials.from_service_account_file(service_json, scopes=SCOPES)
+    gc = gspread.authorize(creds)
+    # авторизованная сессия gspread ходит через общий keep-alive пул
+    gc.session.mount("https://", clients.http_adapter())
+    gc.set_timeout(clients.http_timeout())
+    return gc
 
-_creds = Credentials.from_service_account_file(SERVICE_JSON, scopes=SCOPES)
-_gc    = gspread.authorize(_creds)
+clients.register("gspread", _make_gspread_client)
 
 # Унифицированные ключи, которые будем возвращать наружу
 CANON_KEYS = ["created_at", "client_name", "client_phone", "service", "comment", "source", "manager", "city", "lead_status", "price"]
@@ -68,9 +77,114 @@ HEADER_NORMALIZE = {
     "price": "price",
 }
 
+# ----------------------------
+# Источники: несколько таблиц и вкладок
+# ----------------------------
+#
+# GOOGLE_SHEET_SOURCES="<id1>:Январь,Февраль;<id2>:*;<id3>"
+#   <id>:Вкл1,Вкл2 — перечисленные вкладки
+#   <id>:*         — все вкладки таблицы
+#   <id>           — первая вкладка
+# Без GOOGLE_SHEET_SOURCES читается первая вкладка GOOGLE_SHEET_ID (как раньше).
+
+SourceSpec = Union[str, Tuple[str, Optional[str]]]
+
+def parse_sources(sources: Optional[Union[str, Iterable[SourceSpec]]] = None) -> Dict[str, List[Optional[str]]]:
+    """
+    Приводит описание источников к {spreadsheet_id: [вкладка | None (первая) | "*" (все), ...]}.
+    Принимает строку в формате GOOGLE_SHEET_SOURCES или список строк/пар (id, вкладка).
+    """
+    if sources is None:
+        sources = os.getenv("GOOGLE_SHEET_SOURCES") or os.getenv("GOOGLE_SHEET_ID") or ""
+    if isinstance(sources, str):
+        sources = [part for part in sources.split(";") if part.strip()]
+
+    plan: Dict[str, List[Optional[str]]] = {}
+    for src in sources:
+        if isinstance(src, str):
+            sheet_id, _, tabs_str = src.strip().partition(":")
+            tabs = [t.strip() for t in tabs_str.split(",") if t.strip()] or [None]
+        else:
+            sheet_id, tab = src
+            tabs = [tab]
+        sheet_id = sheet_id.strip()
+        if not sheet_id:
+            continue
+        for tab in tabs:
+            if tab not in plan.setdefault(sheet_id, []):
+                plan[sheet_id].append(tab)
+    return plan
+
+_spreadsheet_cls = None
+
+def _spreadsheet_class():
+    """
+    gspread.Spreadsheet, который запоминает метаданные, прочитанные при открытии.
+    open_by_key уже запрашивает их (вместе со списком вкладок), а worksheets() запросил бы ещё раз.
+    """
+    global _spreadsheet_cls
+    if _spreadsheet_cls is None:
+        import gspread
+
+        class _Spreadsheet(gspread.Spreadsheet):
+            metadata: Optional[Dict[str, Any]] = None
+
+            def fetch_sheet_metadata(self, params=None):
+                meta = super().fetch_sheet_metadata(params)
+                if params is None:
+                    self.metadata = meta
+                return meta
+
+        _spreadsheet_cls = _Spreadsheet
+    return _spreadsheet_cls
+
+def _open_spreadsheet(sheet_id: str):
+    """Как gc.open_by_key (один запрос метаданных), но метаданные остаются в sh.metadata."""
+    from gspread.exceptions import APIError, SpreadsheetNotFound
+    try:
+        return _spreadsheet_class()(clients.get("gspread"), {"id": sheet_id})
+    except APIError as ex:
+        if ex.response.status_code == 404:
+            raise SpreadsheetNotFound(ex.response) from ex
+        raise
+
+def _tab_titles(sh) -> List[str]:
+    """Названия вкладок из метаданных, прочитанных при открытии (без повторного запроса)."""
+    meta = getattr(sh, "metadata", None) or sh.fetch_sheet_metadata()
+    return [ws["properties"]["title"] for ws in meta.get("sheets", [])]
+
+def _a1_tab(title: str) -> str:
+    return "'" + title.replace("'", "''") + "'"
+
+def _range_title(a1: str) -> str:
+    """"'Январь'!A1:F10" -> "Январь"."""
+    title = a1.rsplit("!", 1)[0] if "!" in a1 else a1
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title
+
+def _fetch_spreadsheet(sheet_id: str, tabs: List[Optional[str]]) -> Tuple[str, List[Tuple[str, List[List[str]]]]]:
+    """
+    Все нужные вкладки одной таблицы: открытие (метаданные) + один values_batch_get —
+    два запроса подряд при любом числе вкладок. Возвращает (название таблицы, [(вкладка, values)]).
+    """
+    sh = _open_spreadsheet(sheet_id)
+    if "*" in tabs:
+        tabs = _tab_titles(sh)
+    # диапазон без имени листа относится к первой вкладке
+    ranges = [_a1_tab(t) if t else "A:ZZ" for t in tabs]
+    resp = sh.values_batch_get(ranges)
+    out = []
+    for tab, vr in zip(tabs, resp.get("valueRanges", [])):
+        out.append((tab or _range_title(vr.get("range", "")), vr.get("values", [])))
+    return sh.title, out
+
 def _open_ws():
-    sh = _gc.open_by_key(GOOGLE_SHEET_ID)
-    return sh.sheet1  # первая вкладка
+    """Первая вкладка GOOGLE_SHEET_ID — туда дозаписываются новые заявки (см. app/sheets_sync.py)."""
+    sheet_id = os.getenv("GOOGLE_SHEET_ID")
+    if not sheet_id:
+        raise RuntimeError("GOOGLE_SHEET_ID не задан в .env")
+    return _open_spreadsheet(sheet_id).sheet1  # первая вкладка
 
 def _parse_iso_date(s: str) -> Optional[date]:
     """Поддержка ISO 8601 с TZ (2025-11-06T10:38:05+03:00) и простых дат."""
@@ -110,38 +224,30 @@ def _normalize_header_row(header: List[str]) -> Dict[str, int]:
             idx_map[canon] = i
     return idx_map
 
-def read_leads(date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Dict[str, Any]]:
-    """
-    Читает строки из таблицы и приводит к ключам:
-    created_at, client_name, client_phone, service, comment, source, manager, city, lead_status, price
-
-    date_from/date_to — строки "YYYY-MM-DD" (опционально).
-    """
-    ws = _open_ws()
-    values = ws.get_all_values()
+def _rows_from_values(values: List[List[str]], d_from: Optional[date], d_to: Optional[date],
+                      source_tab: str) -> Iterator[Dict[str, Any]]:
+    """Строки одной вкладки -> словари с каноническими ключами (заголовок вкладки разбирается отдельно)."""
     if not values:
-        return []
+        return
 
     header = [ (h or "").strip() for h in values[0] ]
     idx_map = _normalize_header_row(header)
     rows = values[1:]
 
-    # даты фильтра
-    d_from = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None
-    d_to   = datetime.strptime(date_to,   "%Y-%m-%d").date() if date_to   else None
-
     def at(r: List[str], i: Optional[int]) -> str:
         if i is None or i < 0:
             return ""
         return (r[i] if 0 <= i < len(r) else "").strip()
 
-    out: List[Dict[str, Any]] = []
     for r in rows:
         row: Dict[str, Any] = {}
         # заполняем канонические поля
         for k in CANON_KEYS:
             col_idx = idx_map.get(k, None)
             row[k] = at(r, col_idx)
+        # телефон — в E.164, чтобы один клиент в разных форматах выглядел одинаково
+        row["client_phone"] = normalize_phone(row["client_phone"]) or row["client_phone"]
+        row["source_tab"] = source_tab
 
         # фильтрация по дате, если задана
         if d_from or d_to:
@@ -153,22 +259,71 @@ def read_leads(date_from: Optional[str] = None, date_to: Optional[str] = None) -
             if d_to and d > d_to:
                 continue
 
-        out.append(row)
+        yield row
+
+def iter_leads(date_from: Optional[str] = None, date_to: Optional[str] = None,
+               sources: Optional[Union[str, Iterable[SourceSpec]]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково отдаёт заявки из всех источников (см. parse_sources).
+    Таблицы читаются параллельно в пуле потоков (SHEETS_MAX_WORKERS, по умолчанию 8),
+    строки отдаются в порядке источников. У каждой строки есть source_tab —
+    вкладка (и название таблицы, если их несколько).
+    """
+    plan = parse_sources(sources)
+    if not plan:
+        raise RuntimeError("GOOGLE_SHEET_ID не задан в .env")
+
+    # даты фильтра
+    d_from = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None
+    d_to   = datetime.strptime(date_to,   "%Y-%m-%d").date() if date_to   else None
 
-    return out
+    multi = len(plan) > 1
+
+    def rows_of(title: str, tabs: List[Tuple[str, List[List[str]]]]) -> Iterator[Dict[str, Any]]:
+        for tab, values in tabs:
+            yield from _rows_from_values(values, d_from, d_to, f"{title} / {tab}" if multi else tab)
+
+    if not multi:
+        (sheet_id, tabs), = plan.items()
+        yield from rows_of(*_fetch_spreadsheet(sheet_id, tabs))
+        return
+
+    workers = min(len(plan), int(os.getenv("SHEETS_MAX_WORKERS", "8")))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sheets-read") as pool:
+        futures = [pool.submit(_fetch_spreadsheet, sid, tabs) for sid, tabs in plan.items()]
+        # таблицы читаются параллельно, но отдаются в порядке plan — порядок строк стабилен между запросами
+        for fut in futures:
+            yield from rows_of(*fut.result())
+
+def read_leads(date_from: Optional[str] = None, date_to: Optional[str] = None,
+               sources: Optional[Union[str, Iterable[SourceSpec]]] = None) -> List[Dict[str, Any]]:
+    """
+    Читает строки из таблиц и приводит к ключам:
+    created_at, client_name, client_phone, service, comment, source, manager, city, lead_status, price
+    (+ source_tab — откуда строка).
+
+    date_from/date_to — строки "YYYY-MM-DD" (опционально).
+    sources — таблицы/вкладки (см. parse_sources), по умолчанию GOOGLE_SHEET_SOURCES или GOOGLE_SHEET_ID.
+    """
+    return list(iter_leads(date_from, date_to, sources))
 
 def compute_summary(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
     Возвращает:
-      total        — всего
-      by_day       — [(YYYY-MM-DD, count), ...]
-      by_service   — [(service, count), ...] (сортировка по убыванию)
+      total          — всего
+      unique_clients — уникальных клиентов (по нормализованному телефону)
+      duplicates     — повторных заявок от тех же клиентов
+      by_day         — [(YYYY-MM-DD, count), ...]
+      by_service     — [(service, count), ...] (сортировка по убыванию)
     """
     total = len(rows)
     by_day: Dict[str, int] = {}
     by_service: Dict[str, int] = {}
+    dedup = Deduplicator()
 
     for r in rows:
+        dedup.seen(r.get("client_phone"))
+
         # по дням
         d = _parse_iso_date(r.get("created_at", ""))
         key_day = d.isoformat() if d else "(без даты)"
@@ -181,7 +336,13 @@ def compute_summary(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     by_day_sorted = sorted(by_day.items(), key=lambda x: x[0])
     by_srv_sorted = sorted(by_service.items(), key=lambda x: (-x[1], x[0]))
 
-    return {"total": total, "by_day": by_day_sorted, "by_service": by_srv_sorted}
+    return {
+        "total": total,
+        "unique_clients": dedup.unique,
+        "duplicates": dedup.duplicates,
+        "by_day": by_day_sorted,
+        "by_service": by_srv_sorted,
+    }
 
 # Локальный тест: python sheets_reader.py --from 2025-11-01 --to 2025-11-06
 if __name__ == "__main__":
@@ -189,9 +350,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--from", dest="dfrom")
     parser.add_argument("--to",   dest="dto")
+    parser.add_argument("--sources", help="как GOOGLE_SHEET_SOURCES: id1:Вкладка1,Вкладка2;id2:*")
     args = parser.parse_args()
 
-    leads = read_leads(args.dfrom, args.dto)
+    leads = read_leads(args.dfrom, args.dto, args.sources)
     print(f"rows: {len(leads)}")
     if leads[:1]:
         print("sample row:", leads[0])
@@ -4,10 +4,11 @@ import time
 import json
 from typing import Iterable, List, Optional, Tuple, Union
 
-import requests
 from requests import Session
 from requests.exceptions import RequestException
 
+import clients
+
 
 class VKAPIError(RuntimeError):
     pass
@@ -19,27 +20,30 @@ class VKPublisher:
         vk_api_key: str,
         group_id: int,
         api_version: str = "5.199",
-        timeout: int = 30,
+        timeout: Optional[float] = None,
         retries: int = 3,
         retry_backoff_sec: float = 1.5,
         session: Optional[Session] = None,
+        api_base: Optional[str] = None,
     ):
         """
         :param vk_api_key: токен доступа с правами wall, photos, groups
         :param group_id: ID группы без минуса (например 123456)
         :param api_version: версия VK API
-        :param timeout: таймаут HTTP запросов (сек)
+        :param timeout: таймаут HTTP запросов (сек), по умолчанию HTTP_TIMEOUT общего пула
         :param retries: кол-во повторов при сетевых ошибках
         :param retry_backoff_sec: множитель бэкоффа между ретраями
-        :param session: опционально — внешний requests.Session
+        :param session: опционально — внешний requests.Session (по умолчанию общий keep-alive пул)
+        :param api_base: базовый URL методов VK (по умолчанию VK_API_BASE из окружения или https://api.vk.com/method)
         """
         self.vk_api_key = vk_api_key
         self.group_id = int(group_id)
         self.api_version = api_version
-        self.timeout = timeout
+        self.timeout = timeout if timeout is not None else clients.http_timeout()
         self.retries = retries
         self.retry_backoff_sec = retry_backoff_sec
-        self.sess = session or requests.Session()
+        self.sess = session or clients.http_session()
+        self.api_base = (api_base or os.getenv("VK_API_BASE") or "https://api.vk.com/method").rstrip("/")
 
     # ----------------------- low-level helpers -----------------------
 
@@ -82,7 +86,7 @@ class VKPublisher:
 
     def _get_wall_upload_url(self) -> str:
         resp = self._get(
-            "https://api.vk.com/method/photos.getWallUploadServer",
+            f"{self.api_base}/photos.getWallUploadServer",
             {
                 "access_token": self.vk_api_key,
                 "v": self.api_version,
@@ -129,7 +133,7 @@ class VKPublisher:
             raise VKAPIError(f"Unexpected upload response: {json.dumps(up, ensure_ascii=False)}")
 
         saved = self._get(
-            "https://api.vk.com/method/photos.saveWallPhoto",
+            f"{self.api_base}/photos.saveWallPhoto",
             {
                 "access_token": self.vk_api_key,
                 "v": self.api_version,
@@ -200,7 +204,7 @@ class VKPublisher:
             else:
                 params["attachments"] = attachments_str
 
-        resp = self._post("https://api.vk.com/method/wall.post", params=params)
+        resp = self._post(f"{self.api_base}/wall.post", params=params)
 
         post_id = resp.get("post_id")
         owner_id = -self.group_id